@@ -0,0 +1,45 @@
+# vim: set fileencoding=utf-8
+
+# Measures worker cold start: the time for a fresh process to import
+# debt.wsgi and get ready to serve a debt URL (URL resolution, reversing and
+# loading the models), for the default and lean profiles.
+#
+# Usage: python bench_startup.py [runs]
+
+import os
+import subprocess
+import sys
+
+CHILD = """
+import sys, time
+start = time.time()
+import debt.wsgi
+from django.core.urlresolvers import resolve, reverse
+from django.db.models import get_models
+resolve('/1/summary/')
+reverse('entries', args=(1,))
+get_models()
+print time.time() - start, len(sys.modules), int('debt.admin' in sys.modules)
+"""
+
+def run(lean, runs):
+  env = dict(os.environ)
+  env['DJANGO_LEAN'] = str(lean)
+  env.setdefault('DJANGO_SETTINGS_MODULE', 'debt.settings')
+  times = []
+  for i in range(runs):
+    out = subprocess.check_output([sys.executable, '-c', CHILD], env=env)
+    elapsed, modules, admin = out.split()
+    times.append(float(elapsed))
+  times.sort()
+  return times[len(times) / 2], times[0], int(modules), admin == '1'
+
+if __name__ == "__main__":
+  runs = 10
+  if len(sys.argv) > 1:
+    runs = int(sys.argv[1])
+
+  for lean in [False, True]:
+    median, best, modules, admin = run(lean, runs)
+    print '%-7s median %.1fms  best %.1fms  %d modules  admin discovered: %s' % (
+      'lean' if lean else 'default', median * 1000, best * 1000, modules, admin)
@@ -0,0 +1,301 @@
+# vim: set fileencoding=utf-8
+
+# Load test for the write views. Threads (optionally in several processes)
+# drive add_entry, edit_entry, delete_entry and add_person through the test
+# client against a new instance, for a fixed time. Then the final head
+# State is checked against what each accepted change should have left
+# there. Reports writes per second, latency percentiles per view, and how
+# many changes are missing from the head State (e.g. lost to two requests
+# cloning the same State at once).
+#
+# The database is bench.db (SQLite, in WAL mode) unless set otherwise in
+# debt/settings_bench.py. With DJANGO_ASYNC_WRITES=True the changes are
+# queued, and a thread applies them during the run, as the apply_changes
+# command would; whatever is left is applied before the check. An edit or
+# delete of a debt which hasn't been applied yet is skipped (and counted),
+# and an entry added instead.
+#
+# Usage: python bench_writes.py [threads] [seconds] [processes]
+
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "debt.settings_bench")
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import close_connection
+from django.db.backends.signals import connection_created
+from django.test.client import Client
+from debt.models import Debt, Instance
+from debt.pending import apply_pending
+
+PEOPLE = 10
+DEBTS = 200
+
+# How often each view is used
+MIX = ['add_entry'] * 5 + ['edit_entry'] * 2 + ['delete_entry'] + ['add_person'] * 2
+
+VIEWS = ['add_entry', 'edit_entry', 'delete_entry', 'add_person']
+
+def wal(sender, connection, **kwargs):
+  if connection.vendor == 'sqlite':
+    connection.cursor().execute('PRAGMA journal_mode=WAL')
+
+connection_created.connect(wal)
+
+def setup():
+  db = settings.DATABASES['default']
+  if db['ENGINE'].endswith('sqlite3'):
+    for suffix in ['', '-wal', '-shm']:
+      if os.path.exists(db['NAME'] + suffix):
+        os.remove(db['NAME'] + suffix)
+  call_command('syncdb', interactive=False, migrate=True, verbosity=0)
+
+  instance = Instance.objects.create(name='Bench')
+  state = instance.state_set.create(reason='Initial import')
+  people = [state.people.create(name='Person %d' % i, email='') for i in range(PEOPLE)]
+  for i in range(DEBTS):
+    debt = state.debts.create(what='Seed %d' % i, debtee=random.choice(people))
+    for person in random.sample(people, 3):
+      debt.subdebt_set.create(cost=100, debtor=person)
+    debt.summarise()
+
+  return instance.id, [x.id for x in people]
+
+class Worker(threading.Thread):
+  def __init__(self, name, instance_id, people, end):
+    threading.Thread.__init__(self)
+    self.name = name
+    self.instance_id = instance_id
+    self.people = people
+    self.end = end
+    self.client = Client()
+    self.n = 0
+    # (view, seconds, accepted)
+    self.timings = []
+    # (kind, name): whether it should be in the head State
+    self.expected = {}
+    self.errors = {}
+    # Edits and deletes not made as the debt hasn't been written yet, by view
+    self.skipped = {}
+    # This worker's debts, which it can edit or delete
+    self.live = []
+
+  def run(self):
+    try:
+      while time.time() < self.end:
+        view = random.choice(MIX)
+        if view in ('edit_entry', 'delete_entry') and not self.live:
+          view = 'add_entry'
+        getattr(self, view)()
+    finally:
+      close_connection()
+
+  def unique(self, prefix):
+    self.n += 1
+    return '%s %s-%d' % (prefix, self.name, self.n)
+
+  def post(self, view, args, data):
+    start = time.time()
+    try:
+      response = self.client.post(reverse(view, args=args), data)
+      accepted = response.status_code in (202, 302)
+    except Exception as e:
+      message = str(e).split('\n')[0]
+      self.errors[message] = self.errors.get(message, 0) + 1
+      accepted = False
+    self.timings.append((view, time.time() - start, accepted))
+    return accepted
+
+  def entry(self, what):
+    return {
+      'debtee': random.choice(self.people),
+      'debtor': random.sample(self.people, 3),
+      'reason': what,
+      'total_cost': '%.2f' % random.uniform(1, 50),
+    }
+
+  # The id of one of this worker's debts, if it has been written. If not
+  # (its change is still queued), the view is counted as skipped.
+  def debt_id(self, what, view):
+    ids = list(Debt.objects.filter(what=what).values_list('id', flat=True)[:1])
+    if len(ids) == 0:
+      self.skipped[view] = self.skipped.get(view, 0) + 1
+      return None
+    return ids[0]
+
+  def add_entry(self):
+    what = self.unique('Entry')
+    if self.post('add_entry', (self.instance_id,), self.entry(what)):
+      self.expected[('debt', what)] = True
+      self.live.append(what)
+
+  def edit_entry(self):
+    old = self.live.pop(random.randrange(len(self.live)))
+    id = self.debt_id(old, 'edit_entry')
+    if id is None:
+      self.live.append(old)
+      self.add_entry()
+      return
+    what = self.unique('Edited')
+    data = self.entry(what)
+    data['date'] = datetime.utcnow().strftime('%d/%m/%Y %H:%M:%S') + ' UTC'
+    if self.post('edit_entry', (self.instance_id, id), data):
+      self.expected[('debt', old)] = False
+      self.expected[('debt', what)] = True
+      self.live.append(what)
+    else:
+      self.live.append(old)
+
+  def delete_entry(self):
+    old = self.live.pop(random.randrange(len(self.live)))
+    id = self.debt_id(old, 'delete_entry')
+    if id is None:
+      self.live.append(old)
+      self.add_entry()
+      return
+    if self.post('delete_entry', (self.instance_id, id), {}):
+      self.expected[('debt', old)] = False
+    else:
+      self.live.append(old)
+
+  def add_person(self):
+    name = self.unique('Person')
+    if self.post('add_person', (self.instance_id,), {'name': name, 'email': '', 'plusone': 0}):
+      self.expected[('person', name)] = True
+
+# Applies queued changes as they come in, until end, as the apply_changes
+# command would
+class Applier(threading.Thread):
+  def __init__(self, instance_id, end):
+    threading.Thread.__init__(self)
+    self.instance_id = instance_id
+    self.end = end
+    self.states = 0
+
+  def run(self):
+    try:
+      while time.time() < self.end:
+        if apply_pending(self.instance_id):
+          self.states += 1
+        else:
+          time.sleep(0.05)
+    finally:
+      close_connection()
+
+def run_process(args):
+  process, instance_id, people, threads, seconds = args
+  random.seed(process)
+  end = time.time() + seconds
+  workers = [Worker('%d.%d' % (process, i), instance_id, people, end) for i in range(threads)]
+  for worker in workers:
+    worker.start()
+  for worker in workers:
+    worker.join()
+
+  timings = []
+  expected = {}
+  errors = {}
+  skipped = {}
+  for worker in workers:
+    timings += worker.timings
+    expected.update(worker.expected)
+    for message, count in worker.errors.items():
+      errors[message] = errors.get(message, 0) + count
+    for view, count in worker.skipped.items():
+      skipped[view] = skipped.get(view, 0) + count
+  return timings, expected, errors, skipped
+
+# Changes which should have left something in (or out of) the head State,
+# but didn't, by kind
+def check(instance_id, expected):
+  if settings.ASYNC_WRITES:
+    while apply_pending(instance_id):
+      pass
+
+  head = Instance.objects.get(id=instance_id).latest_state()
+  found = {
+    'debt': set(head.debts.values_list('what', flat=True)),
+    'person': set(head.people.values_list('name', flat=True)),
+  }
+  lost = {'debt': 0, 'person': 0}
+  for (kind, name), present in expected.items():
+    if (name in found[kind]) != present:
+      lost[kind] += 1
+  return head, lost
+
+def percentile(values, p):
+  return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+if __name__ == "__main__":
+  threads = 8
+  seconds = 10.0
+  processes = 1
+  if len(sys.argv) > 1:
+    threads = int(sys.argv[1])
+  if len(sys.argv) > 2:
+    seconds = float(sys.argv[2])
+  if len(sys.argv) > 3:
+    processes = int(sys.argv[3])
+
+  instance_id, people = setup()
+  # Don't share the connection with the workers
+  close_connection()
+
+  args = [(i, instance_id, people, threads, seconds) for i in range(processes)]
+  start = time.time()
+  applier = None
+  if settings.ASYNC_WRITES:
+    applier = Applier(instance_id, start + seconds)
+    applier.start()
+  if processes == 1:
+    results = [run_process(args[0])]
+  else:
+    results = Pool(processes).map(run_process, args)
+  if applier:
+    applier.join()
+  elapsed = time.time() - start
+
+  timings = []
+  expected = {}
+  errors = {}
+  skipped = {}
+  for t, e, r, s in results:
+    timings += t
+    expected.update(e)
+    for message, count in r.items():
+      errors[message] = errors.get(message, 0) + count
+    for view, count in s.items():
+      skipped[view] = skipped.get(view, 0) + count
+
+  accepted = len([x for x in timings if x[2]])
+  print '%s, %d processes x %d threads, %.1fs%s' % (
+    settings.DATABASES['default']['ENGINE'].split('.')[-1], processes, threads, elapsed,
+    ', queued writes' if settings.ASYNC_WRITES else '')
+  print '%d writes accepted (%d failed): %.1f writes/s' % (accepted, len(timings) - accepted, accepted / elapsed)
+
+  for view in VIEWS:
+    times = sorted([x[1] for x in timings if x[0] == view])
+    if times:
+      print '  %-13s %5d  p50 %7.1fms  p90 %7.1fms  p99 %7.1fms  max %7.1fms' % (view, len(times),
+        percentile(times, 50) * 1000, percentile(times, 90) * 1000, percentile(times, 99) * 1000, times[-1] * 1000)
+  print 'skipped: %d edits, %d deletes of debts not yet written' % (
+    skipped.get('edit_entry', 0), skipped.get('delete_entry', 0))
+  if applier:
+    print 'applied during the run in %d States' % applier.states
+
+  head, lost = check(instance_id, expected)
+  print 'head State: %d debts, %d people, %d States' % (
+    head.debts.count(), head.people.count(), head.instance.state_set.count())
+  print 'lost: %d of %d changes not reflected in the head State (%d debts, %d people)' % (
+    lost['debt'] + lost['person'], len(expected), lost['debt'], lost['person'])
+
+  for message, count in sorted(errors.items(), key=lambda x: -x[1])[:5]:
+    print '  error x%d: %s' % (count, message)
@@ -4,5 +4,11 @@ from debt.models import Instance, Person, Debt, SubDebt
 admin.site.register(Instance)
 admin.site.register(Person)
 admin.site.register(Debt)
-admin.site.register(SubDebt)
+
+class SubDebtAdmin(admin.ModelAdmin):
+  def save_model(self, request, obj, form, change):
+    obj.save()
+    obj.debt.summarise()
+
+admin.site.register(SubDebt, SubDebtAdmin)
 
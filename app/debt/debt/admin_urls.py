@@ -0,0 +1,5 @@
+from django.contrib import admin
+admin.autodiscover()
+
+# Mounted lazily from debt.urls, under the 'admin' namespace
+urlpatterns = admin.site.get_urls()
@@ -0,0 +1,173 @@
+from collections import defaultdict
+from django.db import transaction
+from django.utils import timezone
+from debt.models import DebtFingerprint, Instance
+
+# Branches: any State, however old, can be cloned on to a named branch, and
+# States cloned from that stay on the branch, so it can be edited (e.g. in
+# bulk, or offline) without touching the main line, whose head is still
+# Instance.latest_state(). A branch is merged into another by a three-way
+# merge against the newest State both heads descend from: the debts and
+# people the branch added or removed since then are applied to a clone of
+# the head being merged into, and the merged State has both heads as its
+# parents. Only the differences in the id sets are looked at, so the cost of
+# a merge grows with the changes since the branches split, not the number
+# of debts.
+#
+# A debt which both sides removed (edited or deleted) is a conflict if they
+# put different debts in its place. Unless one side is preferred, a merge
+# with conflicts raises MergeConflict and nothing is written. A debt added
+# on both sides (by fingerprint) is only added once.
+
+OURS = 1
+THEIRS = 2
+
+class MergeConflict(Exception):
+  def __init__(self, conflicts):
+    super(MergeConflict, self).__init__('%d conflicting debts' % len(conflicts))
+    self.conflicts = conflicts
+
+# A debt both sides removed, with the debts each side replaced it with
+class Conflict:
+  def __init__(self, debt, ours, theirs):
+    self.debt = debt
+    self.ours = ours
+    self.theirs = theirs
+
+@transaction.commit_on_success
+def branch(state, name, reason=None):
+  name = name.strip()
+  if not name:
+    raise ValueError('Branches must be named')
+  # Serialise with other writes to the instance (see debt.views)
+  Instance.objects.select_for_update().get(id=state.instance_id)
+  if state.instance.state_set.filter(branch=name).exists():
+    raise ValueError('Branch already exists: ' + name)
+  return state.clone(reason or 'Branching from: ' + state.reason, name)
+
+# States which have only just been created have naive dates
+def age(state):
+  date = state.date
+  if timezone.is_naive(date):
+    date = timezone.make_aware(date, timezone.get_default_timezone())
+  return (date, state.id)
+
+# Walk back from both heads, newest State first, marking each State with
+# which heads it's an ancestor of. All of a State's descendants are newer,
+# so are reached before it; the first State reached from both heads is the
+# merge base. Returns it with the States only reached from one head.
+def walk(ours, theirs):
+  flags = defaultdict(int)
+  flags[ours.id] |= OURS
+  flags[theirs.id] |= THEIRS
+  queue = dict([(ours.id, ours), (theirs.id, theirs)])
+  sides = []
+  while queue:
+    state = max(queue.values(), key=age)
+    del queue[state.id]
+    if flags[state.id] == OURS | THEIRS:
+      return state, sides
+    sides.append((state, flags[state.id]))
+    for parent in state.parents():
+      flags[parent.id] |= flags[state.id]
+      queue.setdefault(parent.id, parent)
+  return None, sides
+
+def merge_base(ours, theirs):
+  return walk(ours, theirs)[0]
+
+def ids(queryset):
+  return set(queryset.values_list('id', flat=True))
+
+def digests(debt_ids):
+  return dict(DebtFingerprint.objects.filter(debt__in=debt_ids).values_list('debt_id', 'digest'))
+
+# The debts (of those still at the head) which one side added in the same
+# changes as it removed each of the given debts
+def replacements(sides, side, removed, added):
+  result = defaultdict(set)
+  for state, flag in sides:
+    if flag != side:
+      continue
+    parents = state.parents().order_by('date')[:1]
+    if len(parents) == 0:
+      continue
+    gone = ids(parents[0].debts.filter(id__in=removed).exclude(id__in=state.debts.all()))
+    if gone:
+      new = ids(state.debts.filter(id__in=added).exclude(id__in=parents[0].debts.all()))
+      for debt in gone:
+        result[debt] |= new
+  return result
+
+# Merge the head of one branch into the head of another (by default the
+# main line), in a new State on the latter. prefer is OURS or THEIRS to
+# settle conflicts by taking that side's version.
+@transaction.commit_on_success
+def merge(instance, branch, into='', prefer=None, reason=None):
+  # Serialise with other writes to the instance (see debt.views)
+  instance = Instance.objects.select_for_update().get(id=instance.id)
+  ours = instance.latest_state(into)
+  theirs = instance.latest_state(branch)
+  base, sides = walk(ours, theirs)
+  if base is None:
+    raise ValueError('Branches have no common history')
+  if base.id == theirs.id:
+    raise ValueError('Nothing to merge from: ' + branch)
+
+  checkpoint_id = ours.checkpoint_id
+  if theirs.checkpoint_id != base.checkpoint_id:
+    if ours.checkpoint_id != base.checkpoint_id:
+      raise ValueError('Both branches have closed a period')
+    checkpoint_id = theirs.checkpoint_id
+
+  ours_added = ids(ours.debts.exclude(id__in=base.debts.all()))
+  ours_removed = ids(base.debts.exclude(id__in=ours.debts.all()))
+  theirs_added = ids(theirs.debts.exclude(id__in=base.debts.all()))
+  theirs_removed = ids(base.debts.exclude(id__in=theirs.debts.all()))
+
+  fingerprints = digests(ours_added | theirs_added)
+  skip = set()
+  drop = set()
+
+  both = ours_removed & theirs_removed
+  if both:
+    ours_repl = replacements(sides, OURS, both, ours_added)
+    theirs_repl = replacements(sides, THEIRS, both, theirs_added)
+    conflicts = []
+    for debt in sorted(both):
+      o = ours_repl[debt]
+      t = theirs_repl[debt]
+      if set([fingerprints.get(x) for x in o]) == set([fingerprints.get(x) for x in t]):
+        continue
+      if prefer == OURS:
+        skip |= t
+      elif prefer == THEIRS:
+        drop |= o
+      else:
+        conflicts.append(Conflict(base.debts.get(id=debt), list(ours.debts.filter(id__in=o)), list(theirs.debts.filter(id__in=t))))
+    if conflicts:
+      raise MergeConflict(conflicts)
+
+  # Debts added on both sides are only added once
+  left = defaultdict(int)
+  for debt in ours_added - drop:
+    if debt in fingerprints:
+      left[fingerprints[debt]] += 1
+  for debt in sorted(theirs_added - skip):
+    if left.get(fingerprints.get(debt), 0) > 0:
+      left[fingerprints[debt]] -= 1
+      skip.add(debt)
+
+  nstate = ours.clone(reason or 'Merging branch: ' + branch)
+  nstate.parent.add(theirs)
+  if checkpoint_id != nstate.checkpoint_id:
+    nstate.checkpoint_id = checkpoint_id
+    nstate.save()
+
+  nstate.debts.add(*list(theirs_added - skip))
+  nstate.debts.remove(*list((theirs_removed - ours_removed) | drop))
+
+  nstate.people.add(*list(ids(theirs.people.exclude(id__in=base.people.all()))))
+  nstate.people.remove(*list(ids(base.people.exclude(id__in=theirs.people.all()))))
+
+  return nstate
@@ -0,0 +1,60 @@
+import operator
+from django.db import transaction
+from django.db.models import Q
+from debt import history
+from debt.models import Debt, Instance, OpeningBalance, State
+
+# Closing a period: every debt in the head state dated before a point (or
+# all of them) is folded into per-person opening balances, recorded against
+# a new checkpoint state which carries only the remaining debts. States
+# cloned from it share its opening balances, so their debt sets, and the
+# work done over them, only grow with activity since the checkpoint. The
+# folded debts are still part of the earlier states, for history.
+
+@transaction.commit_on_success
+def close_period(instance, before=None):
+  # Serialise with other writes to the instance (see debt.views)
+  instance = Instance.objects.select_for_update().get(id=instance.id)
+  latest = instance.latest_state()
+
+  if before:
+    folded = latest.debts.filter(date__lt=before)
+    kept = latest.debts.filter(date__gte=before)
+    reason = 'Closing debts before: ' + before.strftime('%d/%m/%Y')
+  else:
+    folded = latest.debts.all()
+    kept = latest.debts.none()
+    reason = 'Closing all debts'
+
+  opening = history.totals(folded, latest)
+
+  nstate = State(instance=instance, reason=reason)
+  nstate.closed = before or nstate.date
+  nstate.save()
+  nstate.checkpoint = nstate
+  nstate.save()
+  nstate.parent.add(latest)
+  nstate.people.add(*list(latest.people.all()))
+  nstate.debts.add(*list(kept))
+
+  OpeningBalance.objects.bulk_create([
+    OpeningBalance(state=nstate, person_id=person, paid=paid, owes=owes)
+    for person, (paid, owes) in opening.items()
+  ])
+
+  return nstate
+
+# The debts folded into a State's opening balances: those of the State each
+# period was closed from which the checkpoint didn't keep
+def folded(state):
+  periods = []
+  closing = state.closing()
+  while closing:
+    parents = closing.parents().order_by('date')[:1]
+    if len(parents) == 0:
+      break
+    periods.append(Q(id__in=parents[0].debts.exclude(id__in=closing.debts.all()).values('id')))
+    closing = parents[0].closing()
+  if len(periods) == 0:
+    return Debt.objects.none()
+  return Debt.objects.filter(reduce(operator.or_, periods))
@@ -0,0 +1,27 @@
+from collections import Counter
+from debt import checkpoint
+from debt.models import DebtFingerprint, fingerprint
+
+# Finding debts which have been entered twice, by their fingerprint (see
+# debt.models.fingerprint). Lookups go through the index on the digest, so
+# are a single query whatever the number of debts. The debts folded into a
+# closed period (see debt.checkpoint) are looked through too, so that they
+# aren't entered again after the period is closed.
+
+# A debt in the state (or folded into its opening balances) which looks the
+# same as the one described, if any
+def find(state, date, what, debtee_id, costs):
+  digest = fingerprint(date, what, debtee_id, costs)
+  for debts in [state.debts.all(), checkpoint.folded(state)]:
+    debts = debts.filter(fingerprint__digest=digest).order_by('-date')[:1]
+    if len(debts) > 0:
+      return debts[0]
+  return None
+
+# How many of each fingerprint the state's debts (and those folded into its
+# opening balances) have, for checking many debts (e.g. an import) against
+# the state without a query per debt
+def counts(state):
+  digests = DebtFingerprint.objects.filter(debt__state=state).values_list('digest', flat=True)
+  folded = DebtFingerprint.objects.filter(debt__in=checkpoint.folded(state)).values_list('digest', flat=True)
+  return Counter(digests) + Counter(folded)
@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from django.conf import settings
+from django.db import close_connection
+from debt.models import State
+
+# Server-sent events for the summary page. A client watching an instance is
+# sent the summary rows which changed each time the head State changes.
+#
+# One thread per process polls the heads of the instances being watched,
+# every EVENTS_POLL_SECONDS, and wakes their watchers when one changes, so
+# an idle watcher makes no queries of its own. It does hold a thread until
+# its stream ends, so the event stream should be served by async workers
+# (see gunicorn.conf.py), under which that is a greenlet; the summary page
+# only opens a stream if settings.LIVE_SUMMARY is on, or it's asked for.
+# Streams end after EVENTS_STREAM_SECONDS; browsers reconnect, sending the
+# last State they saw as Last-Event-ID.
+#
+# Watchers wait on the condition without a timeout, as in Python 2 a timed
+# wait polls (every 50ms, per watcher). Instead the poller wakes them once a
+# watcher's time is up, as well as when a head changes.
+
+_heads = {}
+_watchers = {}
+_deadlines = []
+_changed = threading.Condition()
+_poller = []
+
+def head_id(instance_id):
+  states = State.objects.filter(instance=instance_id, branch='').order_by('-date', '-id')
+  ids = list(states.values_list('id', flat=True)[:1])
+  if len(ids) == 0:
+    return None
+  return ids[0]
+
+def _poll():
+  while True:
+    time.sleep(settings.EVENTS_POLL_SECONDS)
+    with _changed:
+      ids = _watchers.keys()
+    if len(ids) == 0:
+      continue
+    heads = dict([(id, head_id(id)) for id in ids])
+    # End the transaction, so the next poll sees States committed since
+    close_connection()
+    with _changed:
+      changed = False
+      for id, head in heads.items():
+        if id in _watchers and _heads.get(id) != head:
+          _heads[id] = head
+          changed = True
+      expired = [x for x in _deadlines if x <= time.time()]
+      if changed or expired:
+        _changed.notify_all()
+
+# Wait up to timeout seconds for the head State of an instance to be other
+# than last. Returns the head State's id.
+def wait(instance_id, last, timeout):
+  with _changed:
+    if len(_poller) == 0:
+      poller = threading.Thread(target=_poll, name='debt-events')
+      poller.daemon = True
+      poller.start()
+      _poller.append(poller)
+
+    _watchers[instance_id] = _watchers.get(instance_id, 0) + 1
+    end = time.time() + timeout
+    _deadlines.append(end)
+    try:
+      while _heads.get(instance_id, last) == last and time.time() < end:
+        _changed.wait()
+      return _heads.get(instance_id, last)
+    finally:
+      _deadlines.remove(end)
+      _watchers[instance_id] -= 1
+      # Nobody is left to keep the head up to date
+      if _watchers[instance_id] == 0:
+        del _watchers[instance_id]
+        _heads.pop(instance_id, None)
+
+# What changed between two sets of summary rows (see views.balance_rows):
+# the rows which are new or different, the ids of the people no longer
+# shown, and the order everyone is now shown in
+def changes(old, new):
+  before = dict([(row['id'], row['key']) for row in old['data']])
+  after = set([row['id'] for row in new['data']])
+  return {
+    'changed': [row for row in new['data'] if before.get(row['id']) != row['key']],
+    'removed': [id for id in before if id not in after],
+    'order': [row['id'] for row in new['data']],
+  }
+
+def event(name, id, data):
+  return 'id: %s\nevent: %s\ndata: %s\n\n' % (id, name, json.dumps(data))
+
+def keepalive():
+  return ':\n\n'
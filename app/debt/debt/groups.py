@@ -0,0 +1,90 @@
+from debt import history
+
+# The plusone tree, for the collapsible groups view. A person's group is
+# them and everyone who is (in turn) their plus one. The group totals are
+# summed bottom up once per State and kept with the tree, so a page only
+# renders the top-level groups, and expanding a group is a lookup of the
+# rows of its members' children.
+#
+# Retired people aren't shown, but count towards the group they're in; their
+# own plus ones are shown in their place.
+
+def css(balance):
+  if balance < 0:
+    return 'danger'
+  if balance > 0:
+    return 'success'
+  return ''
+
+def row(id, name, paid, owes, children):
+  return {
+    'id': id,
+    'name': name,
+    'paid_gbp': "%.2f" % (paid / 100.0),
+    'owes_gbp': "%.2f" % (owes / 100.0),
+    'balance_gbp': "%.2f" % ((paid - owes) / 100.0),
+    'balance': paid - owes,
+    'class': css(paid - owes),
+    'children': children,
+  }
+
+# {'roots': [person id], 'children': {person id: [person id]},
+#  'rows': {person id: row}}, with each list in balance order
+def tree(state):
+  people = dict([(x[0], x) for x in state.people.values_list('id', 'name', 'plusone_id', 'retired')])
+  totals = history.state_totals(state)
+
+  children = dict([(id, []) for id in people])
+  tops = []
+  for id, (_, _, plusone, _) in people.items():
+    if plusone in people:
+      children[plusone].append(id)
+    else:
+      tops.append(id)
+
+  # Top down, so the groups can be summed bottom up. Anyone not reached is
+  # under a loop of plus ones, so is made a top-level group instead.
+  order = []
+  seen = set()
+  for id in tops + sorted(people):
+    if id in seen:
+      continue
+    if id not in tops:
+      tops.append(id)
+      for members in children.values():
+        if id in members:
+          members.remove(id)
+    stack = [id]
+    seen.add(id)
+    while stack:
+      k = stack.pop()
+      order.append(k)
+      for c in children[k]:
+        if c not in seen:
+          seen.add(c)
+          stack.append(c)
+
+  groups = dict([(id, list(totals.get(id, [0, 0]))) for id in people])
+  for id in reversed(order):
+    for c in children[id]:
+      groups[id][0] += groups[c][0]
+      groups[id][1] += groups[c][1]
+
+  def shown(ids):
+    result = []
+    for id in ids:
+      if people[id][3]:
+        result.extend(shown(children[id]))
+      else:
+        result.append(id)
+    return sorted(result, key=lambda x: groups[x][0] - groups[x][1])
+
+  visible = {}
+  rows = {}
+  for id in people:
+    if people[id][3]:
+      continue
+    visible[id] = shown(children[id])
+    rows[id] = row(id, people[id][1], groups[id][0], groups[id][1], len(visible[id]) > 0)
+
+  return {'roots': shown(tops), 'children': visible, 'rows': rows}
@@ -0,0 +1,161 @@
+import threading
+from collections import OrderedDict
+from django.utils import timezone
+from debt.models import OpeningBalance, SubDebt
+
+# Per-person totals for a State: {person id: [paid, owes]}, in pence,
+# including any opening balances from a closed period (see debt.checkpoint).
+#
+# A State differs from its parent by only the debts the change added or
+# removed, so the totals at a State are worked out by finding the nearest
+# State up the parent chain whose totals are already known and replaying
+# the debt-set differences from there. The totals of recently viewed States
+# are kept in an LRU, so stepping through the changes list is cheap, as is
+# a new head State once its parent has been viewed. If no known State is
+# close (or none of the instance's are known), the State's debts are summed
+# directly.
+#
+# A State is filled in within the transaction which creates it, so is never
+# seen half written, and never changes after. They're stored by
+# State.cache_key(), which a new State reusing a deleted one's id doesn't
+# share.
+
+SNAPSHOTS = 128
+
+# Beyond this many changes, summing the State's debts directly is cheaper
+MAX_REPLAY = 20
+
+# {State.cache_key(): (instance id, totals)}
+_snapshots = OrderedDict()
+# {instance id: how many of its States are in _snapshots}
+_instances = {}
+_lock = threading.Lock()
+
+# Must be called holding _lock
+def _drop(key):
+  instance_id, totals = _snapshots.pop(key)
+  _instances[instance_id] -= 1
+  if _instances[instance_id] == 0:
+    del _instances[instance_id]
+
+def _get(state):
+  with _lock:
+    entry = _snapshots.pop(state.cache_key(), None)
+    if entry is None:
+      return None
+    _snapshots[state.cache_key()] = entry
+    return entry[1]
+
+def _put(state, totals):
+  with _lock:
+    if state.cache_key() in _snapshots:
+      _drop(state.cache_key())
+    _snapshots[state.cache_key()] = (state.instance_id, totals)
+    _instances[state.instance_id] = _instances.get(state.instance_id, 0) + 1
+    while len(_snapshots) > SNAPSHOTS:
+      _drop(next(iter(_snapshots)))
+
+def _known(instance_id):
+  with _lock:
+    return instance_id in _instances
+
+def forget(state):
+  with _lock:
+    if state.cache_key() in _snapshots:
+      _drop(state.cache_key())
+
+def clear():
+  with _lock:
+    _snapshots.clear()
+    _instances.clear()
+
+def _add(totals, debts, sign):
+  for debtee_id, cost in debts.values_list('debtee_id', 'total_cost'):
+    totals.setdefault(debtee_id, [0, 0])[0] += sign * cost
+  subdebts = SubDebt.objects.filter(debt__in=debts)
+  for debtor_id, cost in subdebts.values_list('debtor_id', 'cost'):
+    totals.setdefault(debtor_id, [0, 0])[1] += sign * cost
+
+# Add (or take away) the opening balances a State starts from
+def _add_opening(totals, state, sign):
+  if not state.checkpoint_id:
+    return
+  balances = OpeningBalance.objects.filter(state=state.checkpoint_id)
+  for person_id, paid, owes in balances.values_list('person_id', 'paid', 'owes'):
+    total = totals.setdefault(person_id, [0, 0])
+    total[0] += sign * paid
+    total[1] += sign * owes
+
+# Totals for the given debts, summed directly, plus the opening balances of
+# the State if given
+def totals(debts, state=None):
+  result = {}
+  _add(result, debts, 1)
+  if state:
+    _add_opening(result, state, 1)
+  return result
+
+def _aware(date):
+  if timezone.is_naive(date):
+    return timezone.make_aware(date, timezone.get_default_timezone())
+  return date
+
+# Totals for a State's debts dated before date. Opening balances can't be
+# split by date, so before the period they close, the folded debts are
+# counted in the State the period was closed from instead, along with
+# whatever has changed since.
+def totals_before(state, date):
+  debts = state.debts.filter(date__lt=date)
+  closing = state.closing()
+  parent = closing and _first_parent(closing)
+  if not parent or _aware(date) >= _aware(closing.closed):
+    return totals(debts, state)
+
+  result = totals_before(parent, date)
+  _add(result, debts.exclude(id__in=closing.debts.all()), 1)
+  _add(result, closing.debts.filter(date__lt=date).exclude(id__in=state.debts.all()), -1)
+  return result
+
+def _first_parent(state):
+  parents = state.parents().order_by('date')[:1]
+  if len(parents) == 0:
+    return None
+  return parents[0]
+
+# Totals for a State, replayed from the nearest known State. The result is
+# shared with the LRU, so must not be modified.
+def state_totals(state):
+  known = _get(state)
+  if known is not None:
+    return known
+
+  # Walk up the (first) parent chain to a State with known totals, if any
+  # of the instance's are
+  steps = []
+  child = state
+  base = None
+  while base is None and len(steps) < MAX_REPLAY and _known(state.instance_id):
+    parent = _first_parent(child)
+    if parent is None:
+      break
+    steps.append((parent, child))
+    base = _get(parent)
+    child = parent
+
+  if base is None:
+    result = totals(state.debts.all(), state)
+    _put(state, result)
+    return result
+
+  current = dict([(k, list(v)) for k, v in base.items()])
+  for parent, child in reversed(steps):
+    _add(current, child.debts.exclude(id__in=parent.debts.all()), 1)
+    _add(current, parent.debts.exclude(id__in=child.debts.all()), -1)
+    if child.checkpoint_id != parent.checkpoint_id:
+      _add_opening(current, child, 1)
+      _add_opening(current, parent, -1)
+    for k in [k for k, v in current.items() if v == [0, 0]]:
+      del current[k]
+    _put(child, dict([(k, list(v)) for k, v in current.items()]))
+
+  return current
@@ -0,0 +1,32 @@
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from debt.models import PendingChange
+from debt.pending import apply_pending
+
+# Worker which applies the changes queued by the entry views
+class Command(NoArgsCommand):
+  help = 'Applies queued changes, one new State per instance per pass'
+
+  option_list = NoArgsCommand.option_list + (
+    make_option('--once', action='store_true', dest='once', default=False,
+      help='Apply the currently queued changes and exit'),
+    make_option('--interval', type='float', dest='interval', default=0.5,
+      help='Seconds to wait between passes when idle'),
+  )
+
+  def handle_noargs(self, **options):
+    while True:
+      instances = PendingChange.objects.filter(status=PendingChange.PENDING).values_list('instance_id', flat=True).distinct()
+      instances = list(instances)
+      # End the read transaction, so the next pass sees newly queued changes
+      transaction.commit_unless_managed()
+      for instance_id in instances:
+        state = apply_pending(instance_id)
+        if state:
+          self.stdout.write('Applied: ' + state.reason)
+      if options['once']:
+        break
+      if len(instances) == 0:
+        time.sleep(options['interval'])
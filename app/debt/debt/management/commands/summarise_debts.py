@@ -0,0 +1,15 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from debt.models import Debt
+
+# Fills in the denormalised subdebt summary and fingerprint on existing debts
+class Command(NoArgsCommand):
+  help = 'Recomputes the total cost, debtors and fingerprint stored on each Debt'
+
+  def handle_noargs(self, **options):
+    count = 0
+    with transaction.commit_on_success():
+      for debt in Debt.objects.all().iterator():
+        debt.summarise()
+        count += 1
+    self.stdout.write('Summarised %d debts' % count)
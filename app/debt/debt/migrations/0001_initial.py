@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'Instance'
+        db.create_table(u'debt_instance', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('name', self.gf('django.db.models.fields.CharField')(max_length=200)),
+        ))
+        db.send_create_signal(u'debt', ['Instance'])
+
+        # Adding model 'Person'
+        db.create_table(u'debt_person', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('name', self.gf('django.db.models.fields.CharField')(max_length=200)),
+            ('email', self.gf('django.db.models.fields.CharField')(max_length=200)),
+            ('plusone', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['debt.Person'], null=True, blank=True)),
+            ('retired', self.gf('django.db.models.fields.BooleanField')(default=False)),
+        ))
+        db.send_create_signal(u'debt', ['Person'])
+
+        # Adding model 'Debt'
+        db.create_table(u'debt_debt', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('what', self.gf('django.db.models.fields.CharField')(max_length=200)),
+            ('date', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now, blank=True)),
+            ('debtee', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['debt.Person'])),
+        ))
+        db.send_create_signal(u'debt', ['Debt'])
+
+        # Adding model 'SubDebt'
+        db.create_table(u'debt_subdebt', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('debt', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['debt.Debt'])),
+            ('cost', self.gf('django.db.models.fields.IntegerField')()),
+            ('debtor', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['debt.Person'])),
+        ))
+        db.send_create_signal(u'debt', ['SubDebt'])
+
+        # Adding model 'State'
+        db.create_table(u'debt_state', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('date', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now, blank=True)),
+            ('reason', self.gf('django.db.models.fields.CharField')(max_length=200)),
+            ('instance', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['debt.Instance'])),
+        ))
+        db.send_create_signal(u'debt', ['State'])
+
+        # Adding M2M table for field people on 'State'
+        m2m_table_name = db.shorten_name(u'debt_state_people')
+        db.create_table(m2m_table_name, (
+            ('id', models.AutoField(verbose_name='ID', primary_key=True, auto_created=True)),
+            ('state', models.ForeignKey(orm[u'debt.state'], null=False)),
+            ('person', models.ForeignKey(orm[u'debt.person'], null=False))
+        ))
+        db.create_unique(m2m_table_name, ['state_id', 'person_id'])
+
+        # Adding M2M table for field debts on 'State'
+        m2m_table_name = db.shorten_name(u'debt_state_debts')
+        db.create_table(m2m_table_name, (
+            ('id', models.AutoField(verbose_name='ID', primary_key=True, auto_created=True)),
+            ('state', models.ForeignKey(orm[u'debt.state'], null=False)),
+            ('debt', models.ForeignKey(orm[u'debt.debt'], null=False))
+        ))
+        db.create_unique(m2m_table_name, ['state_id', 'debt_id'])
+
+        # Adding M2M table for field parent on 'State'
+        m2m_table_name = db.shorten_name(u'debt_state_parent')
+        db.create_table(m2m_table_name, (
+            ('id', models.AutoField(verbose_name='ID', primary_key=True, auto_created=True)),
+            ('from_state', models.ForeignKey(orm[u'debt.state'], null=False)),
+            ('to_state', models.ForeignKey(orm[u'debt.state'], null=False))
+        ))
+        db.create_unique(m2m_table_name, ['from_state_id', 'to_state_id'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'Instance'
+        db.delete_table(u'debt_instance')
+
+        # Deleting model 'Person'
+        db.delete_table(u'debt_person')
+
+        # Deleting model 'Debt'
+        db.delete_table(u'debt_debt')
+
+        # Deleting model 'SubDebt'
+        db.delete_table(u'debt_subdebt')
+
+        # Deleting model 'State'
+        db.delete_table(u'debt_state')
+
+        # Removing M2M table for field people on 'State'
+        db.delete_table(db.shorten_name(u'debt_state_people'))
+
+        # Removing M2M table for field debts on 'State'
+        db.delete_table(db.shorten_name(u'debt_state_debts'))
+
+        # Removing M2M table for field parent on 'State'
+        db.delete_table(db.shorten_name(u'debt_state_parent'))
+
+
+    models = {
+        u'debt.debt': {
+            'Meta': {'object_name': 'Debt'},
+            'date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'blank': 'True'}),
+            'debtee': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'what': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.instance': {
+            'Meta': {'object_name': 'Instance'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.person': {
+            'Meta': {'object_name': 'Person'},
+            'email': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'plusone': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']", 'null': 'True', 'blank': 'True'}),
+            'retired': ('django.db.models.fields.BooleanField', [], {'default': 'False'})
+        },
+        u'debt.state': {
+            'Meta': {'object_name': 'State'},
+            'date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'blank': 'True'}),
+            'debts': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['debt.Debt']", 'symmetrical': 'False'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'instance': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Instance']"}),
+            'parent': ('django.db.models.fields.related.ManyToManyField', [], {'blank': 'True', 'related_name': "'parent_rel_+'", 'null': 'True', 'to': u"orm['debt.State']"}),
+            'people': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['debt.Person']", 'symmetrical': 'False'}),
+            'reason': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.subdebt': {
+            'Meta': {'object_name': 'SubDebt'},
+            'cost': ('django.db.models.fields.IntegerField', [], {}),
+            'debt': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Debt']"}),
+            'debtor': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        }
+    }
+
+    complete_apps = ['debt']
\ No newline at end of file
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding field 'Debt.total_cost'
+        db.add_column(u'debt_debt', 'total_cost',
+                      self.gf('django.db.models.fields.IntegerField')(default=0),
+                      keep_default=False)
+
+        # Adding field 'Debt.debtor_count'
+        db.add_column(u'debt_debt', 'debtor_count',
+                      self.gf('django.db.models.fields.IntegerField')(default=0),
+                      keep_default=False)
+
+        # Adding field 'Debt.debtor_names'
+        db.add_column(u'debt_debt', 'debtor_names',
+                      self.gf('django.db.models.fields.TextField')(default='', blank=True),
+                      keep_default=False)
+
+
+    def backwards(self, orm):
+        # Deleting field 'Debt.total_cost'
+        db.delete_column(u'debt_debt', 'total_cost')
+
+        # Deleting field 'Debt.debtor_count'
+        db.delete_column(u'debt_debt', 'debtor_count')
+
+        # Deleting field 'Debt.debtor_names'
+        db.delete_column(u'debt_debt', 'debtor_names')
+
+
+    models = {
+        u'debt.debt': {
+            'Meta': {'object_name': 'Debt'},
+            'date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'blank': 'True'}),
+            'debtee': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']"}),
+            'debtor_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'debtor_names': ('django.db.models.fields.TextField', [], {'default': "''", 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'total_cost': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'what': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.instance': {
+            'Meta': {'object_name': 'Instance'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.person': {
+            'Meta': {'object_name': 'Person'},
+            'email': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'plusone': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']", 'null': 'True', 'blank': 'True'}),
+            'retired': ('django.db.models.fields.BooleanField', [], {'default': 'False'})
+        },
+        u'debt.state': {
+            'Meta': {'object_name': 'State'},
+            'date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'blank': 'True'}),
+            'debts': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['debt.Debt']", 'symmetrical': 'False'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'instance': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Instance']"}),
+            'parent': ('django.db.models.fields.related.ManyToManyField', [], {'blank': 'True', 'related_name': "'parent_rel_+'", 'null': 'True', 'to': u"orm['debt.State']"}),
+            'people': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['debt.Person']", 'symmetrical': 'False'}),
+            'reason': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.subdebt': {
+            'Meta': {'object_name': 'SubDebt'},
+            'cost': ('django.db.models.fields.IntegerField', [], {}),
+            'debt': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Debt']"}),
+            'debtor': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        }
+    }
+
+    complete_apps = ['debt']
\ No newline at end of file
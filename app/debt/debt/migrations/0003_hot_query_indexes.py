@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding index on 'Debt', fields ['date']
+        db.create_index(u'debt_debt', ['date'])
+
+        # Adding index on 'State', fields ['instance', 'date']
+        db.create_index(u'debt_state', ['instance_id', 'date'])
+
+        # A debtor listed twice on a debt owes both parts: merge them into one
+        # SubDebt for the total, so the unique constraint can be added
+        if not db.dry_run:
+            dupes = list(orm['debt.SubDebt'].objects.values('debt', 'debtor').annotate(
+                n=models.Count('id'), total=models.Sum('cost'), first=models.Min('id')).filter(n__gt=1))
+            for dupe in dupes:
+                subdebts = orm['debt.SubDebt'].objects.filter(debt=dupe['debt'], debtor=dupe['debtor'])
+                subdebts.filter(id=dupe['first']).update(cost=dupe['total'])
+                subdebts.exclude(id=dupe['first']).delete()
+
+            # The debtors of the merged debts are summarised once each
+            for id in set([x['debt'] for x in dupes]):
+                names = list(orm['debt.SubDebt'].objects.filter(debt=id).order_by('id').values_list('debtor__name', flat=True))
+                orm['debt.Debt'].objects.filter(id=id).update(debtor_count=len(names), debtor_names='\n'.join(names))
+
+        # Adding unique constraint on 'SubDebt', fields ['debt', 'debtor']
+        db.create_unique(u'debt_subdebt', ['debt_id', 'debtor_id'])
+
+        # Adding index on 'Person', fields ['name']
+        db.create_index(u'debt_person', ['name'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'Person', fields ['name']
+        db.delete_index(u'debt_person', ['name'])
+
+        # Removing unique constraint on 'SubDebt', fields ['debt', 'debtor']
+        db.delete_unique(u'debt_subdebt', ['debt_id', 'debtor_id'])
+
+        # Removing index on 'State', fields ['instance', 'date']
+        db.delete_index(u'debt_state', ['instance_id', 'date'])
+
+        # Removing index on 'Debt', fields ['date']
+        db.delete_index(u'debt_debt', ['date'])
+
+
+    models = {
+        u'debt.debt': {
+            'Meta': {'object_name': 'Debt'},
+            'date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True', 'blank': 'True'}),
+            'debtee': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']"}),
+            'debtor_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'debtor_names': ('django.db.models.fields.TextField', [], {'default': "''", 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'total_cost': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'what': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.instance': {
+            'Meta': {'object_name': 'Instance'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.person': {
+            'Meta': {'object_name': 'Person'},
+            'email': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200', 'db_index': 'True'}),
+            'plusone': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']", 'null': 'True', 'blank': 'True'}),
+            'retired': ('django.db.models.fields.BooleanField', [], {'default': 'False'})
+        },
+        u'debt.state': {
+            'Meta': {'object_name': 'State', 'index_together': "(('instance', 'date'),)"},
+            'date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'blank': 'True'}),
+            'debts': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['debt.Debt']", 'symmetrical': 'False'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'instance': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Instance']"}),
+            'parent': ('django.db.models.fields.related.ManyToManyField', [], {'blank': 'True', 'related_name': "'parent_rel_+'", 'null': 'True', 'to': u"orm['debt.State']"}),
+            'people': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['debt.Person']", 'symmetrical': 'False'}),
+            'reason': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.subdebt': {
+            'Meta': {'unique_together': "(('debt', 'debtor'),)", 'object_name': 'SubDebt'},
+            'cost': ('django.db.models.fields.IntegerField', [], {}),
+            'debt': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Debt']"}),
+            'debtor': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        }
+    }
+
+    complete_apps = ['debt']
\ No newline at end of file
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'PendingChange'
+        db.create_table(u'debt_pendingchange', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('instance', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['debt.Instance'])),
+            ('kind', self.gf('django.db.models.fields.CharField')(max_length=10)),
+            ('reason', self.gf('django.db.models.fields.CharField')(max_length=200)),
+            ('debt', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['debt.Debt'], null=True, blank=True)),
+            ('what', self.gf('django.db.models.fields.CharField')(max_length=200, blank=True)),
+            ('debtee', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['debt.Person'], null=True, blank=True)),
+            ('date', self.gf('django.db.models.fields.DateTimeField')(null=True, blank=True)),
+            ('costs', self.gf('django.db.models.fields.TextField')(blank=True)),
+            ('queued', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now, blank=True)),
+            ('status', self.gf('django.db.models.fields.CharField')(default='pending', max_length=10)),
+            ('state', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['debt.State'], null=True, blank=True)),
+            ('error', self.gf('django.db.models.fields.CharField')(max_length=200, blank=True)),
+        ))
+        db.send_create_signal(u'debt', ['PendingChange'])
+
+        # Adding index on 'PendingChange', fields ['instance', 'status']
+        db.create_index(u'debt_pendingchange', ['instance_id', 'status'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'PendingChange', fields ['instance', 'status']
+        db.delete_index(u'debt_pendingchange', ['instance_id', 'status'])
+
+        # Deleting model 'PendingChange'
+        db.delete_table(u'debt_pendingchange')
+
+
+    models = {
+        u'debt.debt': {
+            'Meta': {'object_name': 'Debt'},
+            'date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True', 'blank': 'True'}),
+            'debtee': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']"}),
+            'debtor_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'debtor_names': ('django.db.models.fields.TextField', [], {'default': "''", 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'total_cost': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'what': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.instance': {
+            'Meta': {'object_name': 'Instance'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.pendingchange': {
+            'Meta': {'object_name': 'PendingChange', 'index_together': "(('instance', 'status'),)"},
+            'costs': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'debt': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Debt']", 'null': 'True', 'blank': 'True'}),
+            'debtee': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']", 'null': 'True', 'blank': 'True'}),
+            'error': ('django.db.models.fields.CharField', [], {'max_length': '200', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'instance': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Instance']"}),
+            'kind': ('django.db.models.fields.CharField', [], {'max_length': '10'}),
+            'queued': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'blank': 'True'}),
+            'reason': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'state': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.State']", 'null': 'True', 'blank': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'default': "'pending'", 'max_length': '10'}),
+            'what': ('django.db.models.fields.CharField', [], {'max_length': '200', 'blank': 'True'})
+        },
+        u'debt.person': {
+            'Meta': {'object_name': 'Person'},
+            'email': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200', 'db_index': 'True'}),
+            'plusone': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']", 'null': 'True', 'blank': 'True'}),
+            'retired': ('django.db.models.fields.BooleanField', [], {'default': 'False'})
+        },
+        u'debt.state': {
+            'Meta': {'object_name': 'State', 'index_together': "(('instance', 'date'),)"},
+            'date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'blank': 'True'}),
+            'debts': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['debt.Debt']", 'symmetrical': 'False'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'instance': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Instance']"}),
+            'parent': ('django.db.models.fields.related.ManyToManyField', [], {'blank': 'True', 'related_name': "'parent_rel_+'", 'null': 'True', 'to': u"orm['debt.State']"}),
+            'people': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['debt.Person']", 'symmetrical': 'False'}),
+            'reason': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.subdebt': {
+            'Meta': {'unique_together': "(('debt', 'debtor'),)", 'object_name': 'SubDebt'},
+            'cost': ('django.db.models.fields.IntegerField', [], {}),
+            'debt': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Debt']"}),
+            'debtor': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        }
+    }
+
+    complete_apps = ['debt']
\ No newline at end of file
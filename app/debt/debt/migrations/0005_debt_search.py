@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+# Full text index over Debt.what, used by debt.search. On SQLite this is an
+# FTS5 table kept in step with debt_debt by triggers; on MySQL a FULLTEXT
+# index. Other databases fall back to a LIKE scan.
+
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE debt_debt_fts USING fts5(what, content='debt_debt', content_rowid='id')",
+    "CREATE TRIGGER debt_debt_fts_insert AFTER INSERT ON debt_debt BEGIN"
+    " INSERT INTO debt_debt_fts(rowid, what) VALUES (new.id, new.what); END",
+    "CREATE TRIGGER debt_debt_fts_delete AFTER DELETE ON debt_debt BEGIN"
+    " INSERT INTO debt_debt_fts(debt_debt_fts, rowid, what) VALUES ('delete', old.id, old.what); END",
+    "CREATE TRIGGER debt_debt_fts_update AFTER UPDATE OF what ON debt_debt BEGIN"
+    " INSERT INTO debt_debt_fts(debt_debt_fts, rowid, what) VALUES ('delete', old.id, old.what);"
+    " INSERT INTO debt_debt_fts(rowid, what) VALUES (new.id, new.what); END",
+    "INSERT INTO debt_debt_fts(debt_debt_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER debt_debt_fts_update",
+    "DROP TRIGGER debt_debt_fts_delete",
+    "DROP TRIGGER debt_debt_fts_insert",
+    "DROP TABLE debt_debt_fts",
+]
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        if db.backend_name == 'sqlite3':
+            for sql in SQLITE_FORWARDS:
+                db.execute(sql)
+        elif db.backend_name == 'mysql':
+            db.execute("CREATE FULLTEXT INDEX debt_debt_what_fulltext ON debt_debt (what)")
+
+    def backwards(self, orm):
+        if db.backend_name == 'sqlite3':
+            for sql in SQLITE_BACKWARDS:
+                db.execute(sql)
+        elif db.backend_name == 'mysql':
+            db.execute("DROP INDEX debt_debt_what_fulltext ON debt_debt")
+
+    models = {
+        u'debt.debt': {
+            'Meta': {'object_name': 'Debt'},
+            'date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True', 'blank': 'True'}),
+            'debtee': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']"}),
+            'debtor_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'debtor_names': ('django.db.models.fields.TextField', [], {'default': "''", 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'total_cost': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'what': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.instance': {
+            'Meta': {'object_name': 'Instance'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.pendingchange': {
+            'Meta': {'object_name': 'PendingChange', 'index_together': "(('instance', 'status'),)"},
+            'costs': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'date': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'debt': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Debt']", 'null': 'True', 'blank': 'True'}),
+            'debtee': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']", 'null': 'True', 'blank': 'True'}),
+            'error': ('django.db.models.fields.CharField', [], {'max_length': '200', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'instance': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Instance']"}),
+            'kind': ('django.db.models.fields.CharField', [], {'max_length': '10'}),
+            'queued': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'blank': 'True'}),
+            'reason': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'state': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.State']", 'null': 'True', 'blank': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'default': "'pending'", 'max_length': '10'}),
+            'what': ('django.db.models.fields.CharField', [], {'max_length': '200', 'blank': 'True'})
+        },
+        u'debt.person': {
+            'Meta': {'object_name': 'Person'},
+            'email': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200', 'db_index': 'True'}),
+            'plusone': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']", 'null': 'True', 'blank': 'True'}),
+            'retired': ('django.db.models.fields.BooleanField', [], {'default': 'False'})
+        },
+        u'debt.state': {
+            'Meta': {'object_name': 'State', 'index_together': "(('instance', 'date'),)"},
+            'date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'blank': 'True'}),
+            'debts': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['debt.Debt']", 'symmetrical': 'False'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'instance': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Instance']"}),
+            'parent': ('django.db.models.fields.related.ManyToManyField', [], {'blank': 'True', 'related_name': "'parent_rel_+'", 'null': 'True', 'to': u"orm['debt.State']"}),
+            'people': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['debt.Person']", 'symmetrical': 'False'}),
+            'reason': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'debt.subdebt': {
+            'Meta': {'unique_together': "(('debt', 'debtor'),)", 'object_name': 'SubDebt'},
+            'cost': ('django.db.models.fields.IntegerField', [], {}),
+            'debt': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Debt']"}),
+            'debtor': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['debt.Person']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        }
+    }
+
+    complete_apps = ['debt']
\ No newline at end of file
@@ -1,6 +1,11 @@
 # vim: set fileencoding=utf-8
 
+import hashlib
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.encoding import force_text
 from datetime import datetime
 
 # Represents an instance of the debt tracks
@@ -9,10 +14,11 @@ class Instance(models.Model):
   # Name of the instance
   name = models.CharField(max_length=200)
 
-  # Latest state
-  def latest_state(self):
+  # Latest state on a branch (by default the main line). Of States from the
+  # same moment (MySQL keeps dates to the second), the last created.
+  def latest_state(self, branch=''):
     try:
-      return self.state_set.order_by('-date')[0]
+      return self.state_set.filter(branch=branch).order_by('-date', '-id')[0]
     except IndexError, e:
       raise State.DoesNotExist(e)
 
@@ -23,7 +29,7 @@ class Instance(models.Model):
 class Person(models.Model):
 
   # Name of the person
-  name = models.CharField(max_length=200)
+  name = models.CharField(max_length=200, db_index=True)
 
   # Email of the person
   email = models.CharField(max_length=200)
@@ -44,23 +50,72 @@ class Debt(models.Model):
   what = models.CharField(max_length=200)
 
   # When was the debt incurred
-  date = models.DateTimeField('date entered', default=datetime.now, blank=True)
+  date = models.DateTimeField('date entered', default=datetime.now, blank=True, db_index=True)
 
   # Who is owed the debt (i.e. who paid)
   debtee = models.ForeignKey(Person)
 
+  # Total of all the subdebts (in pence), maintained by summarise()
+  total_cost = models.IntegerField(default=0)
+
+  # Number of people who owe part of the debt, maintained by summarise()
+  debtor_count = models.IntegerField(default=0)
+
+  # Names of the people who owe part of the debt, one per line
+  debtor_names = models.TextField(blank=True, default='')
+
   def cost(self):
-    return sum([x.cost for x in self.subdebt_set.all()])
+    return self.total_cost
 
   def cost_gbp(self):
     return "%.2f" % (self.cost() / 100.0)
 
   def debtors(self):
-    return [x.debtor.name for x in self.subdebt_set.all()]
+    if not self.debtor_names:
+      return []
+    return self.debtor_names.split('\n')
+
+  # Recompute the denormalised subdebt summary from the subdebts. Debts are
+  # never changed once created (edits create new Debts), so whatever writes
+  # a debt's subdebts calls this once, after the last of them.
+  def summarise(self):
+    subdebts = self.subdebt_set.select_related('debtor').order_by('id')
+    self.total_cost = sum([x.cost for x in subdebts])
+    self.debtor_count = len(subdebts)
+    self.debtor_names = '\n'.join([x.debtor.name for x in subdebts])
+    Debt.objects.filter(id=self.id).update(
+      total_cost=self.total_cost,
+      debtor_count=self.debtor_count,
+      debtor_names=self.debtor_names)
+    costs = dict([(x.debtor_id, x.cost) for x in subdebts])
+    DebtFingerprint(debt=self, digest=fingerprint(self.date, self.what, self.debtee_id, costs)).save()
 
   def __unicode__(self):
     return self.what + " on " + str(self.date)
 
+# Hash of what a debt is: the day it was incurred, what for, who paid, and
+# who owes how much (a dict of debtor id to cost in pence). Two debts with
+# the same fingerprint are very likely the same debt entered twice.
+def fingerprint(date, what, debtee_id, costs):
+  if timezone.is_aware(date):
+    date = timezone.localtime(date)
+  parts = [date.strftime('%Y-%m-%d'), force_text(what).strip(), str(debtee_id)]
+  parts += ['%d:%d' % x for x in sorted([(int(k), v) for k, v in costs.items()])]
+  return hashlib.sha1(u'\n'.join(parts).encode('utf-8')).hexdigest()
+
+# The fingerprint of a debt, maintained by Debt.summarise. Kept apart from
+# Debt so that it can be indexed without remaking debt_debt.
+class DebtFingerprint(models.Model):
+
+  # The debt
+  debt = models.OneToOneField(Debt, primary_key=True, related_name='fingerprint')
+
+  # See fingerprint()
+  digest = models.CharField(max_length=40, db_index=True)
+
+  def __unicode__(self):
+    return self.digest
+
 # Represents the money that a person may be owed
 class SubDebt(models.Model):
 
@@ -73,9 +128,19 @@ class SubDebt(models.Model):
   # Who owes the debt (i.e. who else was there)
   debtor = models.ForeignKey(Person)
 
+  class Meta:
+    unique_together = (('debt', 'debtor'),)
+
   def __unicode__(self):
     return str(self.debtor) + " owes " + ("%.2f" % (self.cost/100.0)) + " for " + str(self.debt)
 
+# Deleting subdebts, including through a queryset, summarises their debt
+# again (unless it was deleted along with them)
+@receiver(post_delete, sender=SubDebt)
+def subdebt_deleted(sender, instance, **kwargs):
+  for debt in Debt.objects.filter(id=instance.debt_id):
+    debt.summarise()
+
 # Represents the state of the system
 class State(models.Model):
 
@@ -91,15 +156,34 @@ class State(models.Model):
   # Reason
   reason = models.CharField(max_length=200, blank=False)
 
-  # The parent state(s)
-  parent = models.ManyToManyField('self', blank=True, null=True)
+  # The parent state(s): those this was cloned (or merged) from
+  parent = models.ManyToManyField('self', blank=True, null=True, symmetrical=False, related_name='+')
 
   # The parent instance
   instance = models.ForeignKey(Instance)
 
-  # Return a clone of this state, setting the parent and reason
-  def clone(self, reason):
-    nstate = State(instance=self.instance, reason=reason)
+  # The state holding the opening balances this state starts from, if a
+  # period has been closed (see debt.checkpoint)
+  checkpoint = models.ForeignKey('self', blank=True, null=True, related_name='+')
+
+  # If the state closed a period, the debts dated before this were folded
+  # into its opening balances
+  closed = models.DateTimeField(blank=True, null=True)
+
+  # The branch the state is on, or blank for the main line (see debt.branching)
+  branch = models.CharField(max_length=200, blank=True, default='')
+
+  class Meta:
+    # latest_state() orders a branch's states by date, the changes list an
+    # instance's
+    index_together = (('instance', 'branch', 'date'), ('instance', 'date'))
+
+  # Return a clone of this state, setting the parent and reason, on the same
+  # branch unless another is given
+  def clone(self, reason, branch=None):
+    if branch is None:
+      branch = self.branch
+    nstate = State(instance=self.instance, reason=reason, checkpoint_id=self.checkpoint_id, branch=branch)
     nstate.save()
     nstate.parent.add(self)
     for debt in self.debts.all():
@@ -108,6 +192,119 @@ class State(models.Model):
       nstate.people.add(person)
     return nstate
 
+  # Identifies the State in caches. The id alone won't do, as a deleted
+  # State's id may be reused. A State which has only just been created has
+  # a naive date.
+  def cache_key(self):
+    date = self.date
+    if timezone.is_naive(date):
+      date = timezone.make_aware(date, timezone.get_default_timezone())
+    return '%d.%s' % (self.id, date.astimezone(timezone.utc).strftime('%Y%m%d%H%M%S%f'))
+
+  def parents(self):
+    return self.parent.all()
+
+  def children(self):
+    return State.objects.filter(parent=self)
+
+  def opening_balances(self):
+    return OpeningBalance.objects.filter(state=self.checkpoint_id)
+
+  # The checkpoint which closed the period this state's opening balances
+  # cover, if any. A checkpoint made to replace a person carries on the
+  # period before it.
+  def closing(self):
+    checkpoint = self.checkpoint
+    while checkpoint and not checkpoint.closed:
+      parents = checkpoint.parents().order_by('date')[:1]
+      if len(parents) == 0:
+        return None
+      checkpoint = parents[0].checkpoint
+    return checkpoint
+
+  # Make this state its own checkpoint, with a copy of its opening balances
+  # in which one person has been replaced by another
+  def replace_opening_person(self, old, new):
+    balances = list(self.opening_balances())
+    for balance in balances:
+      balance.id = None
+      balance.state = self
+      if balance.person_id == old.id:
+        balance.person = new
+    OpeningBalance.objects.bulk_create(balances)
+    self.checkpoint = self
+    self.save()
+
   def __unicode__(self):
     return self.reason
 
+# Represents what a person had paid and owed in total when the debts before
+# a checkpoint state were closed off
+class OpeningBalance(models.Model):
+
+  # The checkpoint state
+  state = models.ForeignKey(State)
+
+  # Who the balance is for
+  person = models.ForeignKey(Person)
+
+  # How much they had paid and owed (in pence)
+  paid = models.IntegerField(default=0)
+  owes = models.IntegerField(default=0)
+
+  class Meta:
+    unique_together = (('state', 'person'),)
+
+  def __unicode__(self):
+    return str(self.person) + " opening at " + str(self.state)
+
+
+# Represents a change to the debts which has been accepted, but not yet
+# applied to a new State (see debt.pending)
+class PendingChange(models.Model):
+
+  ADD = 'add'
+  EDIT = 'edit'
+  DELETE = 'delete'
+
+  PENDING = 'pending'
+  APPLIED = 'applied'
+  FAILED = 'failed'
+
+  # The instance the change is for
+  instance = models.ForeignKey(Instance)
+
+  # Add, edit or delete
+  kind = models.CharField(max_length=10)
+
+  # Reason
+  reason = models.CharField(max_length=200)
+
+  # The debt being edited or deleted
+  debt = models.ForeignKey(Debt, blank=True, null=True)
+
+  # The new debt, for an add or edit
+  what = models.CharField(max_length=200, blank=True)
+  debtee = models.ForeignKey(Person, blank=True, null=True)
+  date = models.DateTimeField(blank=True, null=True)
+
+  # JSON object mapping debtor ids to costs (in pence)
+  costs = models.TextField(blank=True)
+
+  # When the change was queued
+  queued = models.DateTimeField(default=datetime.now, blank=True)
+
+  # Pending, applied or failed
+  status = models.CharField(max_length=10, default=PENDING)
+
+  # The state the change was applied in
+  state = models.ForeignKey(State, blank=True, null=True)
+
+  # Why the change failed
+  error = models.CharField(max_length=200, blank=True)
+
+  class Meta:
+    index_together = (('instance', 'status'),)
+
+  def __unicode__(self):
+    return self.reason
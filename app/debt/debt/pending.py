@@ -0,0 +1,88 @@
+import json
+from django.db import transaction
+from debt.models import Instance, PendingChange, State
+
+# Queued writes: when settings.ASYNC_WRITES is on, the add, edit and delete
+# entry views validate the change and queue it here instead of cloning the
+# head State during the request. apply_pending() (run by the apply_changes
+# command) then applies each instance's queued changes in order, all in one
+# new State.
+
+def enqueue(instance, kind, reason, debt=None, what='', debtee=None, date=None, costs=None):
+  return instance.pendingchange_set.create(
+    kind=kind,
+    reason=reason,
+    debt=debt,
+    what=what,
+    debtee=debtee,
+    date=date,
+    costs=json.dumps(costs or {}))
+
+def apply_change(state, change):
+  if change.kind in (PendingChange.EDIT, PendingChange.DELETE):
+    if not state.debts.filter(id=change.debt_id).exists():
+      raise ValueError('Debt is no longer present: ' + str(change.debt_id))
+
+  if change.kind in (PendingChange.ADD, PendingChange.EDIT):
+    costs = json.loads(change.costs)
+    people = state.people.in_bulk([int(x) for x in costs.keys() + [change.debtee_id]])
+    if len(people) != len(set(costs.keys() + [str(change.debtee_id)])):
+      raise ValueError('Person is no longer present')
+
+    if change.date:
+      debt = state.debts.create(what=change.what, debtee_id=change.debtee_id, date=change.date)
+    else:
+      debt = state.debts.create(what=change.what, debtee_id=change.debtee_id)
+
+    for debtor, cost in costs.items():
+      debt.subdebt_set.create(cost=cost, debtor=people[int(debtor)])
+    debt.summarise()
+
+  if change.kind in (PendingChange.EDIT, PendingChange.DELETE):
+    state.debts.remove(change.debt_id)
+
+# Apply all of an instance's queued changes, in the order they were queued,
+# in a single new State. Returns the new State, or None if nothing applied.
+def apply_pending(instance_id):
+  with transaction.commit_on_success():
+    # Serialise workers on the instance row
+    instance = Instance.objects.select_for_update().get(id=instance_id)
+    changes = list(instance.pendingchange_set.filter(status=PendingChange.PENDING).order_by('id'))
+    if len(changes) == 0:
+      return None
+
+    if len(changes) == 1:
+      reason = changes[0].reason
+    else:
+      reason = 'Applying %d changes: ' % len(changes) + '; '.join([x.reason for x in changes])
+      if len(reason) > 200:
+        reason = reason[:197] + '...'
+
+    try:
+      nstate = instance.latest_state().clone(reason)
+    except State.DoesNotExist:
+      nstate = None
+
+    applied = 0
+    for change in changes:
+      sid = transaction.savepoint()
+      try:
+        if not nstate:
+          raise ValueError('Instance has no state')
+        apply_change(nstate, change)
+      except ValueError as e:
+        transaction.savepoint_rollback(sid)
+        change.status = PendingChange.FAILED
+        change.error = str(e)[:200]
+      else:
+        transaction.savepoint_commit(sid)
+        change.status = PendingChange.APPLIED
+        change.state = nstate
+        applied += 1
+      change.save()
+
+    if nstate and applied == 0:
+      nstate.delete()
+      nstate = None
+
+    return nstate
@@ -0,0 +1,59 @@
+from collections import defaultdict
+
+# What a proposed debt would do to everyone's balance, for the add and edit
+# forms to show as they are filled in. It's worked out from the head
+# State's summary rows (see views.balance_rows) and the proposed debt alone,
+# so nothing is written and no State is cloned. As on the summary page, a
+# plus one's balance counts towards their host's row, and only the people
+# with a row are shown.
+
+# The change in each person's balance (in pence) from adding a debt, paid
+# by debtee_id and owed as costs ({debtor id: pence}), in place of the debt
+# replaces if given
+def deltas(debtee_id, costs, replaces=None):
+  result = defaultdict(int)
+  result[debtee_id] += sum(costs.values())
+  for debtor, cost in costs.items():
+    result[debtor] -= cost
+  if replaces:
+    result[replaces.debtee_id] -= replaces.total_cost
+    for debtor, cost in replaces.subdebt_set.values_list('debtor_id', 'cost'):
+      result[debtor] += cost
+  return dict([(k, v) for k, v in result.items() if v != 0])
+
+def gbp(pence):
+  return "%.2f" % (pence / 100.0)
+
+# Whose summary row a person's balance is counted in: their plus one's (in
+# turn), or their own. plusones is {person id: plusone id} for everyone in
+# the State.
+def host(id, plusones):
+  seen = set()
+  while plusones.get(id) in plusones and id not in seen:
+    seen.add(id)
+    id = plusones[id]
+  return id
+
+# A row for each summary row which would change, by name. rows are the
+# State's summary rows.
+def preview(rows, plusones, debtee_id, costs, replaces=None):
+  shown = dict([(row['id'], row) for row in rows])
+  change = defaultdict(int)
+  for id, delta in deltas(debtee_id, costs, replaces).items():
+    change[host(id, plusones)] += delta
+  result = []
+  for id, delta in change.items():
+    if delta == 0 or id not in shown:
+      continue
+    before = shown[id]['balance']
+    result.append({
+      'id': id,
+      'name': shown[id]['name'],
+      'before': before,
+      'delta': delta,
+      'after': before + delta,
+      'before_gbp': gbp(before),
+      'delta_gbp': gbp(delta),
+      'after_gbp': gbp(before + delta),
+    })
+  return sorted(result, key=lambda x: x['name'])
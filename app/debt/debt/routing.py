@@ -0,0 +1,51 @@
+import threading
+from django.conf import settings
+
+# Read/write splitting. Views marked with @replica_reads send their queries
+# to the 'replica' database, if one is configured; everything else uses
+# 'default'. Once a request has written to the primary, the client is
+# pinned to the primary for REPLICA_PIN_SECONDS (by a cookie) so that they
+# see their own change, whatever the replica's lag.
+
+REPLICA = 'replica'
+PIN_COOKIE = 'debt_primary'
+
+_request = threading.local()
+
+def replica_reads(view):
+  view.replica_reads = True
+  return view
+
+def has_replica():
+  return REPLICA in settings.DATABASES
+
+class ReplicaRouter(object):
+  def db_for_read(self, model, **hints):
+    if getattr(_request, 'replica', False):
+      return REPLICA
+    return 'default'
+
+  def db_for_write(self, model, **hints):
+    _request.wrote = True
+    return 'default'
+
+  def allow_relation(self, obj1, obj2, **hints):
+    return True
+
+class ReplicaMiddleware(object):
+  def process_request(self, request):
+    _request.replica = False
+    _request.wrote = False
+
+  def process_view(self, request, view_func, view_args, view_kwargs):
+    _request.replica = (has_replica()
+      and getattr(view_func, 'replica_reads', False)
+      and request.method in ('GET', 'HEAD')
+      and PIN_COOKIE not in request.COOKIES)
+
+  def process_response(self, request, response):
+    if getattr(_request, 'wrote', False):
+      response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS)
+    _request.replica = False
+    _request.wrote = False
+    return response
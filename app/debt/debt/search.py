@@ -0,0 +1,58 @@
+import re
+from django.db import connections
+
+# Searching the debts in a state. The text search uses the full text index
+# created by migration 0005: FTS5 on SQLite, FULLTEXT on MySQL. Any other
+# database falls back to a LIKE scan of the state's debts.
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+def words(text):
+  return WORD.findall(text)
+
+def match_text(debts, text):
+  terms = words(text)
+  if len(terms) == 0:
+    return debts
+
+  table = debts.model._meta.db_table
+  vendor = connections[debts.db].vendor
+
+  if vendor == 'sqlite':
+    # Every word must appear, each matched as a prefix
+    query = ' '.join(['"%s"*' % term for term in terms])
+    return debts.extra(
+      where=[table + '.id IN (SELECT rowid FROM debt_debt_fts WHERE debt_debt_fts MATCH %s)'],
+      params=[query])
+
+  if vendor == 'mysql':
+    query = ' '.join(['+%s*' % term for term in terms])
+    return debts.extra(
+      where=['MATCH (' + table + '.what) AGAINST (%s IN BOOLEAN MODE)'],
+      params=[query])
+
+  for term in terms:
+    debts = debts.filter(what__icontains=term)
+  return debts
+
+# The debts in the state matching all of the given filters, newest first.
+# Costs are in pence, and compare against the debt's total cost.
+def search(state, text=None, debtee=None, debtor=None, date_from=None, date_to=None, cost_min=None, cost_max=None):
+  debts = state.debts.all()
+
+  if text:
+    debts = match_text(debts, text)
+  if debtee:
+    debts = debts.filter(debtee=debtee)
+  if debtor:
+    debts = debts.filter(subdebt__debtor=debtor)
+  if date_from:
+    debts = debts.filter(date__gte=date_from)
+  if date_to:
+    debts = debts.filter(date__lt=date_to)
+  if cost_min is not None:
+    debts = debts.filter(total_cost__gte=cost_min)
+  if cost_max is not None:
+    debts = debts.filter(total_cost__lte=cost_max)
+
+  return debts.select_related('debtee').order_by('-date', '-id')
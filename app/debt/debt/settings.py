@@ -5,6 +5,20 @@ import os
 DEBUG = (os.environ["DJANGO_DEBUG"] == "True")
 TEMPLATE_DEBUG = DEBUG
 
+# Lean profile for production workers: only what the debt views need is
+# installed, so workers start faster. Run the admin from a non-lean process.
+LEAN = (os.environ.get("DJANGO_LEAN", "False") == "True")
+
+# Queue entry changes for the apply_changes worker, rather than creating the
+# new State during the request (see debt.pending)
+ASYNC_WRITES = (os.environ.get("DJANGO_ASYNC_WRITES", "False") == "True")
+
+# Keep every summary page up to date with an event stream (see debt.events).
+# Each open page holds its stream for up to EVENTS_STREAM_SECONDS, so only
+# turn this on when served by async workers (see gunicorn.conf.py); until
+# then a page can still ask for it with ?live=1.
+LIVE_SUMMARY = (os.environ.get("DJANGO_LIVE_SUMMARY", "False") == "True")
+
 ADMINS = (
   (os.environ["DJANGO_ADMIN_NAME"], os.environ["DJANGO_ADMIN_EMAIL"])
 )
@@ -23,6 +37,25 @@ DATABASES = {
     }
 }
 
+# Read-only views read from a replica of the database, if one is given (see
+# debt.routing). After a write, a client reads from the primary for
+# REPLICA_PIN_SECONDS, which should cover the replica's usual lag.
+if "DJANGO_DB_REPLICA_HOST" in os.environ:
+  DATABASES['replica'] = dict(DATABASES['default'],
+    HOST=os.environ["DJANGO_DB_REPLICA_HOST"],
+    TEST_MIRROR='default')
+
+DATABASE_ROUTERS = ['debt.routing.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = 10
+
+# The summary event stream (see debt.events): how often the head States are
+# checked, how often an idle stream is sent a comment to keep it open, and
+# how long before a stream is ended (clients reconnect)
+EVENTS_POLL_SECONDS = 1
+EVENTS_KEEPALIVE_SECONDS = 15
+EVENTS_STREAM_SECONDS = 300
+
 # Hosts/domain names that are valid for this site; required if DEBUG is False
 # See https://docs.djangoproject.com/en/1.5/ref/settings/#allowed-hosts
 ALLOWED_HOSTS = []
@@ -63,19 +96,27 @@ MEDIA_URL = ''
 # Don't put anything in this directory yourself; store your static files
 # in apps' "static/" subdirectories and in STATICFILES_DIRS.
 # Example: "/var/www/example.com/static/"
-STATIC_ROOT = ''
+STATIC_ROOT = os.environ.get("DJANGO_STATIC_ROOT",
+  os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'collected-static'))
 
 # URL prefix for static files.
 # Example: "http://example.com/static/", "http://static.example.com/"
-STATIC_URL = '/static/'
+STATIC_URL = os.environ.get("DJANGO_STATIC_URL", '//static-debt.scarlet.dev.richardwhiuk.com/')
 
 # Additional locations of static files
 STATICFILES_DIRS = (
     # Put strings here, like "/home/html/static" or "C:/www/django/static".
     # Always use forward slashes, even on Windows.
     # Don't forget to use absolute paths, not relative paths.
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'static'),
 )
 
+# "manage.py collectstatic" collects the static files under hashed names,
+# with gzip (and brotli) copies and a manifest of the names for the
+# templates. The web server should serve STATIC_ROOT with far-future
+# expiry, preferring the precompressed files (e.g. nginx's gzip_static).
+STATICFILES_STORAGE = 'debt.storage.CompressedManifestStorage'
+
 # List of finder classes that know how to find static files in
 # various locations.
 STATICFILES_FINDERS = (
@@ -94,16 +135,44 @@ TEMPLATE_LOADERS = (
 #     'django.template.loaders.eggs.Loader',
 )
 
+# Keep compiled templates in memory, except when developing templates
+if not TEMPLATE_DEBUG:
+  TEMPLATE_LOADERS = (
+    ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+  )
+
+# Holds the precomputed summary rows and the rendered summary and entries
+# rows (see debt.views.balances and the debt templates). Every process has
+# its own copy.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000
+        }
+    },
+    # Hashed static file names, filled from the collectstatic manifest
+    'staticfiles': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'staticfiles',
+    }
+}
+
 MIDDLEWARE_CLASSES = (
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'debt.routing.ReplicaMiddleware',
     # Uncomment the next line for simple clickjacking protection:
     # 'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
 
+if LEAN:
+  MIDDLEWARE_CLASSES = tuple(x for x in MIDDLEWARE_CLASSES
+    if x != 'django.contrib.messages.middleware.MessageMiddleware')
+
 ROOT_URLCONF = 'debt.urls'
 
 # Python dotted path to the WSGI application used by Django's runserver.
@@ -126,9 +195,18 @@ INSTALLED_APPS = (
     'django.contrib.admin',
     # Uncomment the next line to enable admin documentation:
     # 'django.contrib.admindocs',
+    'south',
     'debt',
 )
 
+if LEAN:
+  INSTALLED_APPS = tuple(x for x in INSTALLED_APPS if x not in (
+    'django.contrib.sites',
+    'django.contrib.messages',
+    'django.contrib.admin',
+    'django.contrib.admindocs',
+  ))
+
 # A sample logging configuration. The only tangible logging
 # performed by this configuration is to send an email to
 # the site admins on every HTTP 500 error when DEBUG=False.
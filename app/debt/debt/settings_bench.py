@@ -0,0 +1,36 @@
+# Settings for bench_writes.py: a single SQLite file (put in WAL mode by the
+# harness, so readers don't wait for the writer) stands in for MySQL, or if
+# DJANGO_BENCH_MYSQL is set, the local MySQL server's debt_bench database.
+# Everything reads from and writes to that one database.
+#
+#   DJANGO_SETTINGS_MODULE=debt.settings_bench python bench_writes.py
+
+import os
+
+os.environ.setdefault("DJANGO_DEBUG", "False")
+
+from debt.settings_local import *
+
+if os.environ.get("DJANGO_BENCH_MYSQL"):
+  DATABASES = {
+      'default': {
+          'ENGINE': 'django.db.backends.mysql',
+          'NAME': 'debt_bench',
+          'USER': 'debt',
+          'PASSWORD': os.environ["DJANGO_DB_PASSWORD"],
+          'HOST': '',
+          'PORT': '',
+      }
+  }
+else:
+  DATABASES = {
+      'default': {
+          'ENGINE': 'django.db.backends.sqlite3',
+          'NAME': os.environ.get("DJANGO_BENCH_DB", 'bench.db'),
+          # Seconds to wait for the write lock
+          'OPTIONS': {'timeout': 30},
+      }
+  }
+
+# The harness drives the views through the test client
+ALLOWED_HOSTS = ['testserver']
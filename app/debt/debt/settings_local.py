@@ -0,0 +1,27 @@
+# Settings for trying the site out locally: two SQLite files stand in for
+# the MySQL primary and its replica. Copy primary.db over replica.db to
+# "replicate"; until then, read-only pages show the replica's older data,
+# except to a client which has just written. Run the tests with the normal
+# settings, as test data is not visible to a second connection.
+#
+#   DJANGO_SETTINGS_MODULE=debt.settings_local python manage.py runserver
+
+import os
+
+os.environ.setdefault("DJANGO_DEBUG", "True")
+os.environ.setdefault("DJANGO_ADMIN_NAME", "")
+os.environ.setdefault("DJANGO_ADMIN_EMAIL", "")
+os.environ.setdefault("DJANGO_DB_PASSWORD", "")
+
+from debt.settings import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'primary.db',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'replica.db',
+    },
+}
@@ -0,0 +1,134 @@
+import sqlite3
+from django.db import connections, router
+from debt.models import Debt, Person, SubDebt, State
+
+# A person's statement: every debt in a state which they paid or owe part
+# of, oldest first, with the effect on their balance and a running balance.
+#
+# The statement is a single ordered query. Where the database has window
+# functions the running balance is computed by the database, so a page is
+# fetched with LIMIT/OFFSET; otherwise the rows up to the end of the page
+# are streamed and summed here. It can be sliced and counted, so can be
+# passed straight to a Paginator. If a period has been closed, the running
+# balance starts from the person's opening balance.
+
+ROWS = """
+  SELECT d.id, d.date, d.what, p.name, d.total_cost,
+    (CASE WHEN d.debtee_id = %%s THEN d.total_cost ELSE 0 END) - COALESCE(s.cost, 0) AS amount
+  FROM %(debt)s d
+  INNER JOIN %(state_debts)s sd ON sd.debt_id = d.id
+  INNER JOIN %(person)s p ON p.id = d.debtee_id
+  LEFT OUTER JOIN %(subdebt)s s ON s.debt_id = d.id AND s.debtor_id = %%s
+  WHERE sd.state_id = %%s AND (d.debtee_id = %%s OR s.id IS NOT NULL)
+"""
+
+def tables():
+  return {
+    'debt': Debt._meta.db_table,
+    'state_debts': State.debts.through._meta.db_table,
+    'person': Person._meta.db_table,
+    'subdebt': SubDebt._meta.db_table,
+  }
+
+def has_window_functions(connection):
+  if connection.vendor == 'sqlite':
+    return sqlite3.sqlite_version_info >= (3, 25, 0)
+  if connection.vendor == 'mysql':
+    return connection.mysql_version >= (8, 0, 2)
+  return connection.vendor in ('postgresql', 'oracle')
+
+class Entry:
+  def __init__(self, row, balance):
+    (self.id, self.date, self.what, self.debtee, self.total_cost, self.amount) = row[:6]
+    self.balance = balance
+  def amount_gbp(self):
+    return "%.2f" % (self.amount / 100.0)
+  def balance_gbp(self):
+    return "%.2f" % (self.balance / 100.0)
+  def total_cost_gbp(self):
+    return "%.2f" % (self.total_cost / 100.0)
+  def as_dict(self):
+    return {
+      'id': self.id,
+      'date': self.date.isoformat(),
+      'what': self.what,
+      'debtee': self.debtee,
+      'total_cost': self.total_cost,
+      'amount': self.amount,
+      'balance': self.balance,
+    }
+
+class Statement:
+  def __init__(self, state, person):
+    self.state = state
+    self.person = person
+    self._count = None
+    self._opening = None
+
+  # Statements are read from wherever the router sends Debt reads
+  def connection(self):
+    return connections[router.db_for_read(Debt)]
+
+  def params(self):
+    return [self.person.id, self.person.id, self.state.id, self.person.id]
+
+  # Balance brought forward from a closed period
+  def opening(self):
+    if self._opening is None:
+      self._opening = 0
+      for balance in self.state.opening_balances().filter(person=self.person):
+        self._opening = balance.paid - balance.owes
+    return self._opening
+
+  def opening_gbp(self):
+    return "%.2f" % (self.opening() / 100.0)
+
+  def count(self):
+    if self._count is None:
+      cursor = self.connection().cursor()
+      cursor.execute('SELECT COUNT(*) FROM (' + (ROWS % tables()) + ') r', self.params())
+      self._count = cursor.fetchone()[0]
+    return self._count
+
+  def __len__(self):
+    return self.count()
+
+  def __getitem__(self, k):
+    if not isinstance(k, slice) or k.step:
+      raise TypeError('Statements can only be sliced')
+    start = k.start or 0
+    stop = k.stop
+    if stop is None:
+      stop = self.count()
+    if stop <= start:
+      return []
+    if has_window_functions(self.connection()):
+      return self.window(start, stop)
+    return self.stream(start, stop)
+
+  def window(self, start, stop):
+    sql = ('SELECT r.*, SUM(r.amount) OVER (ORDER BY r.date, r.id ROWS UNBOUNDED PRECEDING)'
+      ' FROM (' + (ROWS % tables()) + ') r ORDER BY r.date, r.id LIMIT %s OFFSET %s')
+    cursor = self.connection().cursor()
+    cursor.execute(sql, self.params() + [stop - start, start])
+    return [Entry(row, self.opening() + row[6]) for row in cursor.fetchall()]
+
+  def stream(self, start, stop):
+    sql = (ROWS % tables()) + ' ORDER BY d.date, d.id'
+    cursor = self.connection().cursor()
+    cursor.execute(sql, self.params())
+    entries = []
+    balance = self.opening()
+    n = 0
+    while n < stop:
+      rows = cursor.fetchmany(500)
+      if not rows:
+        break
+      for row in rows:
+        balance += row[5]
+        if n >= start:
+          entries.append(Entry(row, balance))
+        n += 1
+        if n == stop:
+          break
+    return entries
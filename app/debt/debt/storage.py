@@ -0,0 +1,76 @@
+import gzip
+import json
+from django.conf import settings
+from django.contrib.staticfiles.storage import CachedFilesMixin, CachedStaticFilesStorage
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+# Static files storage for collectstatic. Files are collected under names
+# including a hash of their contents (so they can be served with far-future
+# expiry), with a gzip copy (and brotli, if the brotli module is installed)
+# alongside each text file for the web server to send as is. The hashed
+# names are written to a manifest in STATIC_ROOT, which workers read once
+# instead of hashing each file on first use.
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.eot', '.ttf', '.html', '.txt')
+
+class CompressedManifestStorage(CachedStaticFilesStorage):
+  manifest_name = 'staticfiles.json'
+
+  def __init__(self, *args, **kwargs):
+    super(CompressedManifestStorage, self).__init__(*args, **kwargs)
+    self.manifest = self.load_manifest()
+
+  def load_manifest(self):
+    try:
+      with open(self.path(self.manifest_name)) as f:
+        return json.load(f)
+    except (IOError, ValueError):
+      return {}
+
+  def save_manifest(self):
+    with open(self.path(self.manifest_name), 'w') as f:
+      json.dump(self.manifest, f, indent=1, sort_keys=True)
+
+  def url(self, name, force=False):
+    if name in self.manifest and (force or not settings.DEBUG):
+      return super(CachedFilesMixin, self).url(self.manifest[name])
+    try:
+      return super(CompressedManifestStorage, self).url(name, force)
+    except ValueError:
+      # Not collected, so there's nothing to hash
+      return super(CachedFilesMixin, self).url(name)
+
+  def post_process(self, paths, dry_run=False, **options):
+    manifest = {}
+    processed_files = super(CompressedManifestStorage, self).post_process(paths, dry_run, **options)
+    for name, hashed_name, processed in processed_files:
+      if isinstance(hashed_name, basestring):
+        manifest[name.replace('\\', '/')] = hashed_name
+        if processed or not self.exists(hashed_name + '.gz'):
+          self.compress(hashed_name)
+      yield name, hashed_name, processed
+
+    if not dry_run:
+      self.manifest = manifest
+      self.save_manifest()
+
+  def compress(self, name):
+    if not name.endswith(COMPRESSIBLE):
+      return
+    path = self.path(name)
+    with open(path, 'rb') as f:
+      content = f.read()
+
+    # mtime=0 keeps the output the same from one build to the next
+    with open(path + '.gz', 'wb') as f:
+      gz = gzip.GzipFile(filename='', mode='wb', fileobj=f, compresslevel=9, mtime=0)
+      gz.write(content)
+      gz.close()
+
+    if brotli:
+      with open(path + '.br', 'wb') as f:
+        f.write(brotli.compress(content))
@@ -5,7 +5,55 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+import gzip
+import json
+import shutil
+import tempfile
+from StringIO import StringIO
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.cache import cache, get_cache
+from django.core.management import call_command
+from django.core.management.commands import syncdb
+from django.core.urlresolvers import reverse
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase
+from django.test.client import Client, RequestFactory
+from django.test.utils import override_settings
+from django.utils import unittest
+from django.utils.datastructures import SortedDict
+from debt import branching, checkpoint, duplicates, events, history
+from debt.models import Instance, Person, Debt, DebtFingerprint, SubDebt, State, OpeningBalance, PendingChange
+from debt.routing import ReplicaMiddleware, replica_reads, PIN_COOKIE, REPLICA
+from debt.search import search
+from debt.statement import Statement
+from debt.storage import CompressedManifestStorage
+
+
+class FlatTestCase(TestCase):
+    """
+    An instance, Flat, whose first State has Alice and Bob in it, with
+    nothing cached from earlier tests.
+    """
+    def setUp(self):
+        cache.clear()
+        history.clear()
+        self.instance = Instance.objects.create(name='Flat')
+        self.state = self.instance.state_set.create(reason='Initial import')
+        self.alice = self.state.people.create(name='Alice', email='alice@example.com')
+        self.bob = self.state.people.create(name='Bob', email='bob@example.com')
+
+    def add_debt(self, state, what, debtee, costs, **extra):
+        """
+        Adds a debt to state, owed as costs: [(debtor, pence)].
+        """
+        debt = state.debts.create(what=what, debtee=debtee, **extra)
+        for debtor, cost in costs:
+            debt.subdebt_set.create(cost=cost, debtor=debtor)
+        debt.summarise()
+        return debt
 
 
 class SimpleTest(TestCase):
@@ -14,3 +62,960 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class DebtSummaryTest(FlatTestCase):
+    def test_summary_follows_subdebts(self):
+        """
+        Tests that writing subdebts fills in the debt's cost and debtors.
+        """
+        debt = self.add_debt(self.state, 'Pizza', self.alice, [(self.alice, 500), (self.bob, 750)])
+
+        debt = Debt.objects.get(id=debt.id)
+        self.assertEqual(debt.cost(), 1250)
+        self.assertEqual(debt.cost_gbp(), '12.50')
+        self.assertEqual(debt.debtor_count, 2)
+        self.assertEqual(debt.debtors(), ['Alice', 'Bob'])
+
+    def test_summary_follows_deleted_subdebts(self):
+        """
+        Tests that deleting subdebts updates the summary, unless the debt went too.
+        """
+        debt = self.add_debt(self.state, 'Pizza', self.alice, [(self.alice, 500), (self.bob, 750)])
+        SubDebt.objects.filter(debtor=self.alice).delete()
+
+        debt = Debt.objects.get(id=debt.id)
+        self.assertEqual(debt.cost(), 750)
+        self.assertEqual(debt.debtors(), ['Bob'])
+
+        debt.delete()
+        self.assertEqual(DebtFingerprint.objects.count(), 0)
+
+    def test_summarise_debts_command(self):
+        """
+        Tests that the backfill command repairs stale summaries.
+        """
+        debt = self.add_debt(self.state, 'Pizza', self.alice, [(self.bob, 500)])
+        Debt.objects.filter(id=debt.id).update(total_cost=0, debtor_count=0, debtor_names='')
+
+        call_command('summarise_debts', stdout=StringIO())
+
+        debt = Debt.objects.get(id=debt.id)
+        self.assertEqual(debt.cost(), 500)
+        self.assertEqual(debt.debtors(), ['Bob'])
+
+
+class BalancesTest(FlatTestCase):
+    def setUp(self):
+        super(BalancesTest, self).setUp()
+        self.add_debt(self.state, 'Pizza', self.alice, [(self.alice, 500), (self.bob, 500)])
+
+    def test_summary_balances(self):
+        """
+        Tests that the summary totals what each person paid and owes.
+        """
+        response = self.client.get(reverse('summary', args=(self.instance.id,)))
+        balances = dict([(x['name'], x['balance']) for x in response.context['data']])
+        self.assertEqual(balances, {'Alice': 500, 'Bob': -500})
+
+    def test_summary_rows_cached(self):
+        """
+        Tests that a State's summary rows are only worked out once.
+        """
+        url = reverse('summary', args=(self.instance.id,))
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertContains(response, '-5.00')
+
+    def test_reused_state_id(self):
+        """
+        Tests that a new State which reuses a deleted State's id isn't shown its rows.
+        """
+        nstate = self.state.clone('Adding new debt for: Chips')
+        self.add_debt(nstate, 'Chips', self.bob, [(self.alice, 200)])
+        url = reverse('summary', args=(self.instance.id,))
+        self.client.get(url)
+        history.state_totals(self.state)
+
+        # Deleted elsewhere, so nothing here is forgotten
+        id = nstate.id
+        nstate.delete()
+        nstate = self.state.clone('Adding new debt for: Pasta')
+        self.add_debt(nstate, 'Pasta', self.bob, [(self.alice, 900)])
+        self.assertEqual(nstate.id, id)
+
+        balances = dict([(x['name'], x['balance']) for x in self.client.get(url).context['data']])
+        self.assertEqual(balances, {'Alice': -400, 'Bob': 400})
+
+    def test_entries_rows_cached(self):
+        """
+        Tests that a new State only renders its new entries' rows.
+        """
+        url = reverse('entries', args=(self.instance.id,))
+        self.client.get(url)
+        Debt.objects.filter(what='Pizza').update(what='Pasta')
+        nstate = self.state.clone('Adding new debt for: Chips')
+        self.add_debt(nstate, 'Chips', self.bob, [(self.alice, 200)])
+
+        response = self.client.get(url)
+        self.assertContains(response, 'Chips')
+        self.assertContains(response, 'Pizza')
+        self.assertNotContains(response, 'Pasta')
+
+
+class UrlsTest(TestCase):
+    def test_admin_reverses(self):
+        """
+        Tests that the lazily included admin can still be reversed.
+        """
+        self.assertEqual(reverse('admin:index'), '/admin/')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class QueryPlanTest(FlatTestCase):
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexed(self, queryset, sorted=False):
+        # Every table is searched, not scanned (even using an index), and
+        # nothing is sorted unless sorted is set
+        plan = self.plan(queryset)
+        for step in plan:
+            self.assertFalse(step.startswith('SCAN'), plan)
+            if 'TEMP B-TREE' in step:
+                self.assertTrue(sorted and step == 'USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_latest_state(self):
+        self.assertIndexed(self.instance.state_set.filter(branch='').order_by('-date', '-id')[:1])
+
+    def test_state_debts_by_date(self):
+        self.assertIndexed(self.state.debts.filter(date__lt=datetime.now()))
+
+    def test_subdebts_by_debtor(self):
+        self.assertIndexed(SubDebt.objects.filter(debtor=self.alice))
+
+    def test_subdebts_for_state(self):
+        self.assertIndexed(SubDebt.objects.filter(debt__in=self.state.debts.all()))
+
+    def test_person_by_name(self):
+        self.assertIndexed(Person.objects.filter(name='Alice'))
+
+    def test_entries(self):
+        # The date isn't in the join table, so a State's debts are sorted
+        # once they have been found
+        self.assertIndexed(self.state.debts.select_related('debtee').order_by('-date'), sorted=True)
+
+    def test_changes(self):
+        self.assertIndexed(self.instance.state_set.order_by('date'))
+
+
+@override_settings(ASYNC_WRITES=True)
+class PendingChangeTest(FlatTestCase):
+    def setUp(self):
+        super(PendingChangeTest, self).setUp()
+        self.debt = self.add_debt(self.state, 'Pizza', self.alice, [(self.bob, 500)])
+
+    def add(self, reason):
+        return self.client.post(reverse('add_entry', args=(self.instance.id,)), {
+            'debtee': self.alice.id,
+            'debtor': [self.alice.id, self.bob.id],
+            'reason': reason,
+            'total_cost': '10.00',
+        })
+
+    def test_changes_are_queued_and_coalesced(self):
+        """
+        Tests that queued changes are applied together in one new State.
+        """
+        response = self.add('Milk')
+        self.assertEqual(response.status_code, 202)
+        poll = json.loads(response.content)['poll']
+        self.add('Bread')
+        self.client.get(reverse('delete_entry', args=(self.instance.id, self.debt.id)))
+        self.assertEqual(self.instance.state_set.count(), 1)
+
+        call_command('apply_changes', once=True, stdout=StringIO())
+
+        self.assertEqual(self.instance.state_set.count(), 2)
+        latest = self.instance.latest_state()
+        self.assertEqual(sorted([x.what for x in latest.debts.all()]), ['Bread', 'Milk'])
+        self.assertEqual(latest.debts.get(what='Milk').debtors(), ['Alice', 'Bob'])
+        status = json.loads(self.client.get(poll).content)
+        self.assertEqual(status['status'], PendingChange.APPLIED)
+        self.assertEqual(status['state'], latest.id)
+
+    def test_added_debt_keeps_its_date(self):
+        """
+        Tests that a queued debt is dated when it was added, not applied.
+        """
+        self.add('Milk')
+        queued = PendingChange.objects.get().date
+        self.assertNotEqual(queued, None)
+
+        call_command('apply_changes', once=True, stdout=StringIO())
+        self.assertEqual(self.instance.latest_state().debts.get(what='Milk').date, queued)
+
+    def test_unknown_change(self):
+        """
+        Tests that polling for a change which doesn't exist is a 404.
+        """
+        response = self.client.get(reverse('pending', args=(self.instance.id, 1234)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_change_to_removed_debt_fails(self):
+        """
+        Tests that a change to a debt deleted earlier in the queue fails alone.
+        """
+        url = reverse('delete_entry', args=(self.instance.id, self.debt.id))
+        self.client.get(url)
+        self.client.get(url)
+        self.add('Milk')
+
+        call_command('apply_changes', once=True, stdout=StringIO())
+
+        statuses = [x.status for x in PendingChange.objects.order_by('id')]
+        self.assertEqual(statuses, [PendingChange.APPLIED, PendingChange.FAILED, PendingChange.APPLIED])
+        self.assertEqual([x.what for x in self.instance.latest_state().debts.all()], ['Milk'])
+
+
+class InstanceLockTest(FlatTestCase):
+    """
+    Every write locks the instance row before cloning the head State, as
+    queued changes are applied. SQLite has no SELECT ... FOR UPDATE, so a
+    comment stands in for it, to be seen in the queries run.
+    """
+    def setUp(self):
+        super(InstanceLockTest, self).setUp()
+        self.debt = self.add_debt(self.state, 'Pizza', self.alice, [(self.bob, 500)])
+        features = connection.features
+        self.addCleanup(setattr, features, 'has_select_for_update', features.has_select_for_update)
+        features.has_select_for_update = True
+        connection.ops.for_update_sql = lambda nowait=False: '/* FOR UPDATE */'
+        self.addCleanup(delattr, connection.ops, 'for_update_sql')
+        self.addCleanup(setattr, connection, 'use_debug_cursor', connection.use_debug_cursor)
+        connection.use_debug_cursor = True
+
+    def assertLocked(self, view, args, data):
+        self.client.post(reverse(view, args=(self.instance.id,) + args), data)
+        queries = [x['sql'] for x in connection.queries]
+        writes = [i for i, sql in enumerate(queries) if sql.startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        locks = [i for i, sql in enumerate(queries) if 'debt_instance' in sql and 'FOR UPDATE' in sql]
+        self.assertTrue(writes, view)
+        self.assertTrue(locks and locks[0] < writes[0], view)
+
+    def test_writes_lock_the_instance(self):
+        """
+        Tests that each view which clones the head locks the instance first.
+        """
+        entry = {'debtee': self.alice.id, 'debtor': [self.bob.id], 'reason': 'Milk', 'total_cost': '1.00'}
+        advanced = {'debtee': self.alice.id, 'debtor.%d' % self.bob.id: '1.00', 'reason': 'Milk'}
+        date = {'date': '01/03/2014 19:00:00 UTC'}
+        self.assertLocked('add_person', (), {'name': 'Carol', 'email': '', 'plusone': 0})
+        self.assertLocked('add_entry', (), entry)
+        self.assertLocked('add_entry_advanced', (), advanced)
+        debt = self.instance.latest_state().debts.latest('id')
+        self.assertLocked('edit_entry', (debt.id,), dict(entry, **date))
+        debt = self.instance.latest_state().debts.latest('id')
+        self.assertLocked('edit_entry_advanced', (debt.id,), dict(advanced, **date))
+        debt = self.instance.latest_state().debts.latest('id')
+        self.assertLocked('delete_entry', (debt.id,), {})
+        self.assertLocked('edit_person', (self.bob.id,), {'name': 'Robert', 'email': '', 'plusone': 0})
+        self.assertLocked('branch_state', (self.instance.latest_state().id,), {'name': 'Trip'})
+        self.assertLocked('merge_branch', (), {'branch': 'Trip'})
+        self.assertLocked('close_period', (), {'before': ''})
+        self.assertLocked('delete_state', (self.instance.latest_state().id,), {})
+
+
+class StatementTest(FlatTestCase):
+    def setUp(self):
+        super(StatementTest, self).setUp()
+        start = datetime(2013, 1, 1)
+        for i in range(5):
+            self.add_debt(self.state, 'Debt %d' % i, [self.alice, self.bob][i % 2],
+                          [(self.alice, 100 * (i + 1)), (self.bob, 100)], date=start + timedelta(days=i))
+        other = self.bob.debt_set.create(what='Elsewhere', date=start)
+        other.subdebt_set.create(cost=100, debtor=self.alice)
+        other.summarise()
+
+    def test_running_balance(self):
+        """
+        Tests that the running balance follows the person's share of each debt.
+        """
+        statement = Statement(self.state, self.alice)
+        self.assertEqual(statement.count(), 5)
+        entries = statement[0:5]
+        self.assertEqual([x.amount for x in entries], [100, -200, 100, -400, 100])
+        self.assertEqual([x.balance for x in entries], [100, -100, 0, -400, -300])
+        self.assertEqual(entries[0].debtee, 'Alice')
+
+    def test_window_matches_stream(self):
+        """
+        Tests that both ways of computing a page agree.
+        """
+        statement = Statement(self.state, self.bob)
+        window = [(x.id, x.amount, x.balance) for x in statement.window(2, 4)]
+        stream = [(x.id, x.amount, x.balance) for x in statement.stream(2, 4)]
+        self.assertEqual(window, stream)
+        self.assertEqual(len(window), 2)
+
+    def test_statement_json(self):
+        """
+        Tests that the statement page and API show the latest page.
+        """
+        response = self.client.get(reverse('statement_json', args=(self.instance.id, self.alice.id)))
+        data = json.loads(response.content)
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(data['entries'][-1]['balance'], -300)
+        response = self.client.get(reverse('statement', args=(self.instance.id, self.alice.id)))
+        self.assertContains(response, 'Debt 4')
+
+        response = self.client.get(reverse('statement_json', args=(self.instance.id, 1234)))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('statement_json', args=(1234, self.alice.id)))
+        self.assertEqual(response.status_code, 404)
+
+
+class HistoryTest(FlatTestCase):
+    def setUp(self):
+        super(HistoryTest, self).setUp()
+        self.states = [self.state]
+        for i in range(4):
+            self.add('Debt %d' % i, 100 * (i + 1))
+        latest = self.instance.latest_state()
+        nstate = latest.clone('Deleting debt')
+        nstate.debts.remove(latest.debts.get(what='Debt 1'))
+        self.states.append(nstate)
+
+    def add(self, what, cost):
+        nstate = self.instance.latest_state().clone('Adding ' + what)
+        self.add_debt(nstate, what, self.alice, [(self.bob, cost)])
+        self.states.append(nstate)
+
+    def test_replay_matches_direct_totals(self):
+        """
+        Tests that replayed totals agree with summing each State's debts.
+        """
+        for state in self.states:
+            direct = history.totals(state.debts.all())
+            self.assertEqual(history.state_totals(state), direct)
+
+    def test_stepping_replays_one_change(self):
+        """
+        Tests that a State next to a known one costs only its differences.
+        """
+        history.state_totals(self.states[2])
+        with self.assertNumQueries(5):
+            totals = history.state_totals(self.states[3])
+        self.assertEqual(totals, {self.alice.id: [600, 0], self.bob.id: [0, 600]})
+
+    def test_new_head_replays_from_viewed_head(self):
+        """
+        Tests that the head's totals are kept once worked out, so the next
+        head only replays its own change.
+        """
+        history.state_totals(self.states[-1])
+        self.add('Debt 4', 500)
+        with self.assertNumQueries(5):
+            totals = history.state_totals(self.states[-1])
+        self.assertEqual(totals, {self.alice.id: [1300, 0], self.bob.id: [0, 1300]})
+
+    def test_nothing_known_sums_directly(self):
+        """
+        Tests that the parent chain isn't walked when none of the instance's
+        States are known.
+        """
+        with self.assertNumQueries(2):
+            totals = history.state_totals(self.states[-1])
+        self.assertEqual(totals, {self.alice.id: [800, 0], self.bob.id: [0, 800]})
+
+    def test_state_summary(self):
+        """
+        Tests the summary of a historical State.
+        """
+        response = self.client.get(reverse('state_summary', args=(self.instance.id, self.states[1].id)))
+        balances = dict([(x['name'], x['balance']) for x in response.context['data']])
+        self.assertEqual(balances, {'Alice': 100, 'Bob': -100})
+
+
+class SearchTest(FlatTestCase):
+    def setUp(self):
+        super(SearchTest, self).setUp()
+        self.add_debt(self.state, 'Pizza and drinks', self.alice, [(self.bob, 1500)], date=datetime(2013, 1, 1))
+        self.add_debt(self.state, 'Pizzeria', self.bob, [(self.alice, 3000)], date=datetime(2013, 2, 1))
+        self.add_debt(self.state, 'Electricity bill', self.alice, [(self.bob, 6000)], date=datetime(2013, 3, 1))
+
+    def found(self, **filters):
+        return [x.what for x in search(self.state, **filters)]
+
+    def test_text(self):
+        """
+        Tests that every word must match, as a prefix.
+        """
+        self.assertEqual(self.found(text='pizz'), ['Pizzeria', 'Pizza and drinks'])
+        self.assertEqual(self.found(text='pizza drink'), ['Pizza and drinks'])
+        self.assertEqual(self.found(text='"OR'), [])
+
+    def test_filters(self):
+        """
+        Tests the person, date and cost filters.
+        """
+        self.assertEqual(self.found(debtee=self.alice), ['Electricity bill', 'Pizza and drinks'])
+        self.assertEqual(self.found(debtor=self.alice), ['Pizzeria'])
+        self.assertEqual(self.found(date_from=datetime(2013, 1, 15), date_to=datetime(2013, 3, 1)), ['Pizzeria'])
+        self.assertEqual(self.found(text='pizza', cost_min=2000), [])
+        self.assertEqual(self.found(cost_min=1500, cost_max=3000), ['Pizzeria', 'Pizza and drinks'])
+
+    def test_scoped_to_state(self):
+        """
+        Tests that only the state's debts are found, including new ones.
+        """
+        nstate = self.state.clone('Deleting debt')
+        nstate.debts.remove(nstate.debts.get(what='Pizzeria'))
+        self.add_debt(nstate, 'Pizza again', self.bob, [(self.alice, 100)])
+        self.assertEqual([x.what for x in search(nstate, text='pizza')], ['Pizza again', 'Pizza and drinks'])
+
+    def test_search_page(self):
+        """
+        Tests the search page and API.
+        """
+        url = reverse('search', args=(self.instance.id,))
+        response = self.client.get(url, {'q': 'bill', 'min': '10'})
+        self.assertEqual([x.what for x in response.context['page'].object_list], ['Electricity bill'])
+        response = self.client.get(reverse('search_json', args=(self.instance.id,)), {'debtor': self.bob.id, 'to': '01/01/2013'})
+        data = json.loads(response.content)
+        self.assertEqual([x['what'] for x in data['entries']], ['Pizza and drinks'])
+        self.assertEqual(data['entries'][0]['debtors'], ['Bob'])
+
+        response = self.client.get(reverse('search_json', args=(1234,)))
+        self.assertEqual(response.status_code, 404)
+
+
+class CheckpointTest(FlatTestCase):
+    def setUp(self):
+        super(CheckpointTest, self).setUp()
+        self.add(self.state, 'Pizza', self.alice, self.bob, 500, datetime(2013, 1, 1))
+        self.add(self.state, 'Rent', self.bob, self.alice, 2000, datetime(2013, 2, 1))
+        self.add(self.state, 'Milk', self.alice, self.bob, 100, datetime(2013, 3, 1))
+
+    def add(self, state, what, debtee, debtor, cost, date):
+        return self.add_debt(state, what, debtee, [(debtor, cost)], date=date)
+
+    def balances(self):
+        response = self.client.get(reverse('summary', args=(self.instance.id,)))
+        return dict([(x['name'], x['balance']) for x in response.context['data']])
+
+    def test_close_period(self):
+        """
+        Tests that closing a period keeps balances, but not the old debts.
+        """
+        before = self.balances()
+        nstate = checkpoint.close_period(self.instance, datetime(2013, 2, 15))
+        self.assertEqual([x.what for x in nstate.debts.all()], ['Milk'])
+        self.assertEqual(nstate.opening_balances().get(person=self.alice).owes, 2000)
+        self.assertEqual(self.balances(), before)
+
+        # Later states carry on from the same opening balances
+        later = nstate.clone('Adding new debt for: Bread')
+        self.add(later, 'Bread', self.bob, self.alice, 300, datetime(2013, 4, 1))
+        self.assertEqual(later.checkpoint_id, nstate.id)
+        self.assertEqual(self.balances(), {'Alice': before['Alice'] - 300, 'Bob': before['Bob'] + 300})
+
+        # Replaying across the checkpoint swaps the old debts for the opening balances
+        history.clear()
+        self.assertEqual(history.state_totals(self.state), history.totals(self.state.debts.all()))
+        self.assertEqual(history.state_totals(nstate), history.totals(nstate.debts.all(), nstate))
+
+        statement = Statement(later, self.alice)
+        self.assertEqual(statement.opening(), -1500)
+        self.assertEqual([x.balance for x in statement[0:2]], [-1400, -1700])
+
+    def dated_balances(self, year, month, day):
+        response = self.client.get(reverse('date', args=(self.instance.id, year, month, day)))
+        return dict([(x['name'], x['balance']) for x in response.context['data']])
+
+    def test_dated_summary_across_checkpoint(self):
+        """
+        Tests that balances from before a checkpoint count the folded debts,
+        and later ones the debts added since.
+        """
+        nstate = checkpoint.close_period(self.instance, datetime(2013, 2, 15))
+        later = nstate.clone('Adding new debt for: Bread')
+        self.add(later, 'Bread', self.bob, self.alice, 300, datetime(2013, 4, 1))
+
+        self.assertEqual(self.dated_balances(2013, 1, 14), {'Alice': 500, 'Bob': -500})
+        self.assertEqual(self.dated_balances(2013, 2, 14), {'Alice': -1500, 'Bob': 1500})
+        self.assertEqual(self.dated_balances(2013, 4, 14), {'Alice': -1700, 'Bob': 1700})
+
+    def test_dated_summary_backdated_after_close(self):
+        """
+        Tests that a debt added after a period closes, but dated inside it,
+        counts towards balances from before the checkpoint.
+        """
+        nstate = checkpoint.close_period(self.instance, datetime(2013, 2, 15))
+        later = nstate.clone('Adding new debt for: Bread')
+        self.add(later, 'Bread', self.bob, self.alice, 300, datetime(2013, 1, 10))
+
+        self.assertEqual(self.dated_balances(2013, 1, 14), {'Alice': 200, 'Bob': -200})
+        self.assertEqual(self.dated_balances(2013, 2, 14), {'Alice': -1800, 'Bob': 1800})
+        self.assertEqual(self.dated_balances(2013, 4, 14), {'Alice': -1700, 'Bob': 1700})
+
+    def test_edit_person_keeps_opening_balance(self):
+        """
+        Tests that editing a person carries their opening balance over.
+        """
+        before = self.balances()
+        checkpoint.close_period(self.instance)
+        self.client.post(reverse('edit_person', args=(self.instance.id, self.bob.id)), {
+            'name': 'Robert', 'email': 'bob@example.com', 'plusone': 0,
+        })
+        self.assertEqual(self.balances(), {'Alice': before['Alice'], 'Robert': before['Bob']})
+        self.assertEqual(OpeningBalance.objects.count(), 4)
+
+
+@replica_reads
+def read_view(request):
+    return HttpResponse(Instance.objects.all().db)
+
+def write_view(request):
+    Instance.objects.create(name='Flat')
+    return HttpResponse(Instance.objects.all().db)
+
+
+@override_settings(DATABASES=dict(settings.DATABASES, replica=settings.DATABASES['default']))
+class RoutingTest(TestCase):
+    def run_view(self, view, method='get', cookies={}):
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies)
+        middleware = ReplicaMiddleware()
+        middleware.process_request(request)
+        middleware.process_view(request, view, (), {})
+        return middleware.process_response(request, view(request))
+
+    def test_read_only_views_use_replica(self):
+        """
+        Tests that marked views read from the replica.
+        """
+        response = self.run_view(read_view)
+        self.assertEqual(response.content, 'replica')
+        self.assertFalse(PIN_COOKIE in response.cookies)
+
+    def test_other_views_use_primary(self):
+        """
+        Tests that unmarked views and posts only use the primary.
+        """
+        self.assertEqual(self.run_view(read_view, method='post').content, 'default')
+        self.assertEqual(self.run_view(write_view).content, 'default')
+
+    def test_writes_pin_client_to_primary(self):
+        """
+        Tests that a client which has written reads its own writes.
+        """
+        response = self.run_view(write_view, method='post')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+        response = self.run_view(read_view, cookies={PIN_COOKIE: '1'})
+        self.assertEqual(response.content, 'default')
+        self.assertEqual(Instance.objects.all().db, 'default')
+
+    @override_settings(DATABASES={'default': settings.DATABASES['default']})
+    def test_no_replica(self):
+        """
+        Tests that everything uses the primary when there is no replica.
+        """
+        self.assertEqual(self.run_view(read_view).content, 'default')
+
+
+REPLICA_DATABASE = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+
+
+@override_settings(DATABASES=dict(settings.DATABASES, replica=REPLICA_DATABASE))
+class ReplicaDatabaseTest(TransactionTestCase):
+    """
+    Requests through the client, with the replica a second SQLite database
+    which nothing is copied to, so what a page shows tells where it was read.
+    """
+    multi_db = True
+
+    @classmethod
+    def setUpClass(cls):
+        # Django's own syncdb, as South only knows the databases it started with
+        connections.databases[REPLICA] = REPLICA_DATABASE
+        syncdb.Command().execute(database=REPLICA, verbosity=0, interactive=False, load_initial_data=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections.databases[REPLICA]
+
+    def setUp(self):
+        self.instance = Instance.objects.create(name='Flat')
+        self.instance.state_set.create(reason='Initial import').people.create(name='Alice', email='')
+        Instance.objects.using(REPLICA).create(id=self.instance.id, name='Flat')
+
+    def test_read_your_writes(self):
+        """
+        Tests that a client which has written reads the primary, and others the replica.
+        """
+        url = reverse('people', args=(self.instance.id,))
+        self.assertNotContains(self.client.get(url), 'Alice')
+
+        self.client.post(reverse('add_person', args=(self.instance.id,)), {'name': 'Bob', 'email': '', 'plusone': 0})
+        self.assertEqual(self.instance.latest_state().people.count(), 2)
+        self.assertContains(self.client.get(url), 'Bob')
+        self.assertNotContains(Client().get(url), 'Bob')
+
+
+class StaticStorageTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        get_cache('staticfiles').clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def collect(self):
+        # As collectstatic does: copy the files, then post process them
+        storage = CompressedManifestStorage(location=self.root, base_url='/static/')
+        paths = SortedDict()
+        for finder in get_finders():
+            for path, source in finder.list(['.*', '*~']):
+                if path.startswith(('css/', 'fonts/', 'js/')):
+                    with source.open(path) as f:
+                        storage.save(path, f)
+                    paths[path] = (storage, path)
+        list(storage.post_process(paths))
+        return storage
+
+    def test_hashed_and_compressed(self):
+        """
+        Tests that collected files are hashed, compressed and in the manifest.
+        """
+        self.collect()
+        storage = CompressedManifestStorage(location=self.root, base_url='/static/')
+        hashed = storage.manifest['css/bootstrap.min.css']
+        self.assertNotEqual(hashed, 'css/bootstrap.min.css')
+        self.assertEqual(storage.url('css/bootstrap.min.css'), '/static/' + hashed)
+
+        with storage.open(hashed) as f:
+            content = f.read()
+        self.assertEqual(gzip.open(storage.path(hashed) + '.gz').read(), content)
+        self.assertTrue(storage.manifest['fonts/glyphicons-halflings-regular.woff'] in content)
+        self.assertFalse(storage.exists(storage.manifest['fonts/glyphicons-halflings-regular.woff'] + '.gz'))
+
+    def test_uncollected(self):
+        """
+        Tests that files which have not been collected keep their name.
+        """
+        storage = CompressedManifestStorage(location=self.root, base_url='/static/')
+        self.assertEqual(storage.url('css/bootstrap.min.css'), '/static/css/bootstrap.min.css')
+
+
+class DuplicateTest(FlatTestCase):
+    def add(self, **extra):
+        data = {
+            'debtee': self.alice.id,
+            'debtor': [self.alice.id, self.bob.id],
+            'reason': 'Pizza',
+            'total_cost': '10.00',
+        }
+        data.update(extra)
+        return self.client.post(reverse('add_entry', args=(self.instance.id,)), data)
+
+    def test_fingerprint(self):
+        """
+        Tests that debts are found by day, what, who paid and who owes what.
+        """
+        debt = self.add_debt(self.state, 'Pizza', self.alice, [(self.alice, 500), (self.bob, 500)],
+                             date=datetime(2014, 3, 1, 19, 0))
+
+        costs = {self.bob.id: 500, self.alice.id: 500}
+        self.assertEqual(duplicates.find(self.state, datetime(2014, 3, 1, 21, 0), 'Pizza ', self.alice.id, costs), debt)
+        self.assertEqual(duplicates.find(self.state, datetime(2014, 3, 2, 19, 0), 'Pizza', self.alice.id, costs), None)
+        self.assertEqual(duplicates.find(self.state, datetime(2014, 3, 1, 19, 0), 'Pizza', self.bob.id, costs), None)
+        self.assertEqual(duplicates.find(self.state, datetime(2014, 3, 1, 19, 0), 'Pizza', self.alice.id, {self.bob.id: 500}), None)
+        self.assertEqual(duplicates.counts(self.state)[debt.fingerprint.digest], 1)
+
+    def test_import_after_close_period(self):
+        """
+        Tests that debts folded into a closed period are still found, so
+        importing the same file again after closing it adds nothing.
+        """
+        date = datetime(2014, 3, 1, 19, 0)
+        pizza = self.add_debt(self.state, 'Pizza', self.alice, [(self.bob, 500)], date=date)
+        milk = self.add_debt(self.state, 'Milk', self.alice, [(self.bob, 100)], date=datetime(2014, 4, 1))
+        checkpoint.close_period(self.instance, datetime(2014, 3, 15))
+        checkpoint.close_period(self.instance)
+        latest = self.instance.latest_state().clone('Importing debts')
+
+        self.assertEqual(latest.debts.count(), 0)
+        self.assertEqual(duplicates.find(latest, date, 'Pizza', self.alice.id, {self.bob.id: 500}), pizza)
+        self.assertEqual(duplicates.counts(latest), {pizza.fingerprint.digest: 1, milk.fingerprint.digest: 1})
+
+    def test_add_entry_warns(self):
+        """
+        Tests that adding the same debt again asks first.
+        """
+        self.add()
+        self.assertEqual(self.instance.latest_state().debts.count(), 1)
+
+        response = self.add()
+        self.assertContains(response, 'Add it again?')
+        self.assertContains(response, 'name="confirm"')
+        self.assertEqual(self.instance.latest_state().debts.count(), 1)
+
+        self.add(confirm='1')
+        self.assertEqual(self.instance.latest_state().debts.count(), 2)
+
+
+class BranchTest(FlatTestCase):
+    def setUp(self):
+        super(BranchTest, self).setUp()
+        self.pizza = self.add(self.state, 'Pizza', 1000)[1]
+
+    def add(self, state, what, cost, replaces=None):
+        nstate = state.clone('Adding ' + what)
+        debt = self.add_debt(nstate, what, self.alice, [(self.bob, cost)])
+        if replaces:
+            nstate.debts.remove(replaces)
+        return nstate, debt
+
+    def debts(self, state):
+        return sorted([x.what for x in state.debts.all()])
+
+    def test_branch_and_merge(self):
+        """
+        Tests that a branch from an old State merges both sides' changes.
+        """
+        first = self.instance.latest_state()
+        main = self.add(first, 'Milk', 200)[0]
+        trip = branching.branch(first, 'trip')
+        self.assertEqual(self.instance.latest_state(), main)
+        self.assertEqual(self.instance.latest_state('trip'), trip)
+
+        trip = self.add(trip, 'Taxi', 1500)[0]
+        main = self.add(main, 'Bread', 100)[0]
+        self.assertEqual(branching.merge_base(main, trip), first)
+
+        merged = branching.merge(self.instance, 'trip')
+        self.assertEqual(self.instance.latest_state(), merged)
+        self.assertEqual(merged.branch, '')
+        self.assertEqual(self.debts(merged), ['Bread', 'Milk', 'Pizza', 'Taxi'])
+        self.assertEqual(sorted([x.id for x in merged.parents()]), sorted([main.id, trip.id]))
+
+        # Merging again starts from the last merge
+        trip = self.add(trip, 'Train', 900, replaces=self.instance.latest_state('trip').debts.get(what='Taxi'))[0]
+        self.assertEqual(branching.merge_base(merged, trip).branch, 'trip')
+        self.assertEqual(self.debts(branching.merge(self.instance, 'trip')), ['Bread', 'Milk', 'Pizza', 'Train'])
+
+    def test_same_second(self):
+        """
+        Tests that which States are parents doesn't depend on their dates,
+        which MySQL keeps only to the second.
+        """
+        first = self.instance.latest_state()
+        branched = branching.branch(first, 'trip')
+        self.instance.state_set.update(date=datetime(2014, 3, 1, 19, 0))
+        self.assertEqual(self.instance.latest_state(), first)
+        self.assertEqual(list(first.children()), [branched])
+
+        # It has been branched from, so can't be deleted
+        self.client.get(reverse('delete_state', args=(self.instance.id, first.id)))
+        self.assertTrue(self.instance.state_set.filter(id=first.id).exists())
+
+        main = self.add(first, 'Milk', 200)[0]
+        trip = self.add(branched, 'Taxi', 1500)[0]
+        self.instance.state_set.update(date=datetime(2014, 3, 1, 19, 0))
+        self.assertEqual(list(main.parents()), [first])
+        self.assertEqual(branching.merge_base(State.objects.get(id=main.id), State.objects.get(id=trip.id)), first)
+
+    def test_conflict(self):
+        """
+        Tests that a debt edited differently on each side is reported.
+        """
+        first = self.instance.latest_state()
+        trip = branching.branch(first, 'trip')
+        self.add(first, 'Pizza', 1200, replaces=self.pizza)
+        self.add(trip, 'Pizza', 800, replaces=self.pizza)
+
+        with self.assertRaises(branching.MergeConflict) as e:
+            branching.merge(self.instance, 'trip')
+        self.assertEqual(len(e.exception.conflicts), 1)
+        self.assertEqual(e.exception.conflicts[0].debt, self.pizza)
+        self.assertEqual([x.cost() for x in e.exception.conflicts[0].theirs], [800])
+
+        response = self.client.post(reverse('merge_branch', args=(self.instance.id,)), {'branch': 'trip'})
+        self.assertContains(response, 'changed differently')
+
+        self.client.post(reverse('merge_branch', args=(self.instance.id,)), {'branch': 'trip', 'prefer': 'theirs'})
+        merged = self.instance.latest_state()
+        self.assertEqual([x.cost() for x in merged.debts.all()], [800])
+
+    def test_same_change(self):
+        """
+        Tests that the same edit on both sides is merged without conflict.
+        """
+        first = self.instance.latest_state()
+        trip = branching.branch(first, 'trip')
+        self.add(first, 'Pizza', 1200, replaces=self.pizza)
+        self.add(trip, 'Pizza', 1200, replaces=self.pizza)
+
+        merged = branching.merge(self.instance, 'trip')
+        self.assertEqual([x.cost() for x in merged.debts.all()], [1200])
+
+
+class GroupTreeTest(FlatTestCase):
+    def setUp(self):
+        super(GroupTreeTest, self).setUp()
+        self.bob.plusone = self.alice
+        self.bob.save()
+        self.carol = self.state.people.create(name='Carol', email='carol@example.com', plusone=self.bob, retired=True)
+        self.dave = self.state.people.create(name='Dave', email='dave@example.com', plusone=self.carol)
+        self.add_debt(self.state, 'Pizza', self.alice, [(self.bob, 300), (self.carol, 200), (self.dave, 100)])
+
+    def test_top_level_only(self):
+        """
+        Tests that only the top-level groups are rendered, with group totals.
+        """
+        response = self.client.get(reverse('group_tree_page', args=(self.instance.id,)))
+        self.assertEqual([x['name'] for x in response.context['data']], ['Alice'])
+        self.assertEqual(response.context['data'][0]['balance_gbp'], '0.00')
+        self.assertNotContains(response, 'Bob')
+
+    def test_expand(self):
+        """
+        Tests that a group's members are fetched with their own group totals.
+        """
+        url = reverse('group_json', args=(self.instance.id, self.state.id, self.alice.id))
+        people = json.loads(self.client.get(url).content)['people']
+        self.assertEqual([(x['name'], x['owes_gbp'], x['children']) for x in people], [('Bob', '6.00', True)])
+
+        # Carol is retired, so Dave is shown in her place
+        url = reverse('group_json', args=(self.instance.id, self.state.id, self.bob.id))
+        people = json.loads(self.client.get(url).content)['people']
+        self.assertEqual([(x['name'], x['owes_gbp'], x['children']) for x in people], [('Dave', '1.00', False)])
+
+    def test_expand_unknown(self):
+        """
+        Tests that expanding a group which isn't shown is a 404.
+        """
+        for args in [(1234, self.state.id, self.alice.id), (self.instance.id, 1234, self.alice.id),
+                     (self.instance.id, self.state.id, 1234), (self.instance.id, self.state.id, self.carol.id)]:
+            self.assertEqual(self.client.get(reverse('group_json', args=args)).status_code, 404)
+
+
+class SummaryEventsTest(FlatTestCase):
+    def setUp(self):
+        super(SummaryEventsTest, self).setUp()
+        self.carol = self.state.people.create(name='Carol', email='carol@example.com')
+        self.add_debt(self.state, 'Pizza', self.alice, [(self.bob, 500)])
+
+    def first_event(self, **extra):
+        response = self.client.get(reverse('summary_events', args=(self.instance.id,)), **extra)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        lines = next(iter(response.streaming_content)).split('\n')
+        response.close()
+        self.assertEqual(lines[1], 'event: balances')
+        return lines[0], json.loads(lines[2][len('data: '):])
+
+    def test_first_event(self):
+        """
+        Tests that a new stream starts with every row.
+        """
+        id, data = self.first_event()
+        self.assertEqual(id, 'id: %d' % self.state.id)
+        self.assertEqual(sorted([x['name'] for x in data['changed']]), ['Alice', 'Bob', 'Carol'])
+        self.assertEqual(data['order'], [self.bob.id, self.carol.id, self.alice.id])
+
+    def test_reconnect(self):
+        """
+        Tests that a reconnecting stream is sent only what has changed since.
+        """
+        nstate = self.state.clone('Adding new debt for: Milk')
+        self.add_debt(nstate, 'Milk', self.alice, [(self.carol, 100)])
+
+        id, data = self.first_event(HTTP_LAST_EVENT_ID=str(self.state.id))
+        self.assertEqual(id, 'id: %d' % nstate.id)
+        self.assertEqual(sorted([x['name'] for x in data['changed']]), ['Alice', 'Carol'])
+        self.assertEqual(data['removed'], [])
+
+    def test_unknown_instance(self):
+        """
+        Tests that watching an instance which doesn't exist is a 404.
+        """
+        response = self.client.get(reverse('summary_events', args=(self.instance.id + 1,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_live_opt_in(self):
+        """
+        Tests that the summary page only opens a stream when asked to.
+        """
+        url = reverse('summary', args=(self.instance.id,))
+        self.assertNotContains(self.client.get(url), 'EventSource')
+        self.assertContains(self.client.get(url, {'live': '1'}), 'EventSource')
+        with self.settings(LIVE_SUMMARY=True):
+            self.assertContains(self.client.get(url), 'EventSource')
+
+    def test_changes(self):
+        """
+        Tests that people no longer shown are listed as removed.
+        """
+        old = {'data': [{'id': 1, 'key': 'a'}, {'id': 2, 'key': 'b'}]}
+        new = {'data': [{'id': 2, 'key': 'c'}]}
+        self.assertEqual(events.changes(old, new), {'changed': [{'id': 2, 'key': 'c'}], 'removed': [1], 'order': [2]})
+
+
+class PreviewTest(FlatTestCase):
+    def setUp(self):
+        super(PreviewTest, self).setUp()
+        self.carol = self.state.people.create(name='Carol', email='carol@example.com')
+        self.debt = self.add_debt(self.state, 'Pizza', self.alice, [(self.bob, 500)])
+
+    def preview(self, data, debt=None):
+        args = (self.instance.id,) if debt is None else (self.instance.id, debt.id)
+        response = self.client.get(reverse('preview_entry', args=args), data)
+        return [(x['name'], x['before'], x['delta'], x['after']) for x in json.loads(response.content)['people']]
+
+    def test_add(self):
+        """
+        Tests that a new debt is previewed against the current balances.
+        """
+        rows = self.preview({'debtee': self.alice.id, 'debtor': [self.alice.id, self.bob.id], 'total_cost': '10.00'})
+        self.assertEqual(rows, [('Alice', 500, 500, 1000), ('Bob', -500, -500, -1000)])
+        self.assertEqual(self.instance.state_set.count(), 1)
+
+        response = self.client.get(reverse('add_entry_advanced', args=(self.instance.id,)))
+        self.assertContains(response, 'data-url="%s"' % reverse('preview_entry', args=(self.instance.id,)))
+
+    def test_edit(self):
+        """
+        Tests that an edit is previewed as replacing the debt.
+        """
+        rows = self.preview({'debtee': self.alice.id, 'debtor.%d' % self.carol.id: '5', 'debtor.%d' % self.bob.id: '0'}, self.debt)
+        self.assertEqual(rows, [('Bob', -500, 500, 0), ('Carol', 0, -500, -500)])
+
+    def test_incomplete(self):
+        """
+        Tests that a form which isn't filled in previews nothing.
+        """
+        self.assertEqual(self.preview({'debtee': self.alice.id, 'total_cost': '10.00'}), [])
+        self.assertEqual(self.preview({'debtee': self.alice.id, 'debtor': [self.bob.id], 'total_cost': 'ten'}), [])
+
+    def test_plusone(self):
+        """
+        Tests that a plus one's share is previewed in their host's row, as
+        the summary shows it.
+        """
+        dave = self.state.people.create(name='Dave', email='', plusone=self.bob)
+        rows = self.preview({'debtee': self.alice.id, 'debtor': [dave.id], 'total_cost': '3.00'})
+        self.assertEqual(rows, [('Alice', 500, 300, 800), ('Bob', -500, -300, -800)])
+
+    def test_retired(self):
+        """
+        Tests that retired people can't be previewed as debtors in the list
+        forms, which don't accept them.
+        """
+        erin = self.state.people.create(name='Erin', email='', retired=True)
+        self.assertEqual(self.preview({'debtee': self.alice.id, 'debtor': [self.bob.id, erin.id], 'total_cost': '3.00'}), [])
@@ -1,9 +1,6 @@
+from django.conf import settings
 from django.conf.urls import patterns, include, url
 
-# Uncomment the next two lines to enable the admin:
-from django.contrib import admin
-admin.autodiscover()
-
 def drl(regex, name):
   return url(regex, 'debt.views.' + name, name=name)
 
@@ -12,24 +9,45 @@ urlpatterns = patterns('',
     #url(r'^$', 'debt.views.home', name='home'),
     drl(r'^(?P<instance_id>\d+)/(?P<year>\d+)/(?P<month>\d+)/(?P<day>\d+)/$', 'date'),
     drl(r'^(?P<instance_id>\d+)/summary/$', 'summary'),
+    drl(r'^(?P<instance_id>\d+)/summary/events/$', 'summary_events'),
     drl(r'^(?P<instance_id>\d+)/detailed/$', 'detailed'),
+    drl(r'^(?P<instance_id>\d+)/groups/$', 'group_tree_page'),
     drl(r'^(?P<instance_id>\d+)/individual/$', 'individual'),
     drl(r'^(?P<instance_id>\d+)/changes/$', 'changes'),
+    drl(r'^(?P<instance_id>\d+)/close/$', 'close_period'),
+    drl(r'^(?P<instance_id>\d+)/state/(?P<state_id>\d+)/summary/$', 'state_summary'),
+    drl(r'^(?P<instance_id>\d+)/state/(?P<state_id>\d+)/groups/(?P<person_id>\d+)/$', 'group_json'),
     drl(r'^(?P<instance_id>\d+)/entries/$', 'entries'),
+    drl(r'^(?P<instance_id>\d+)/search/$', 'search'),
+    drl(r'^(?P<instance_id>\d+)/search/json/$', 'search_json'),
     drl(r'^(?P<instance_id>\d+)/add/$', 'add_entry'),
     drl(r'^(?P<instance_id>\d+)/add/advanced/$', 'add_entry_advanced'),
     drl(r'^(?P<instance_id>\d+)/add/person/$', 'add_person'),
+    drl(r'^(?P<instance_id>\d+)/preview/$', 'preview_entry'),
+    drl(r'^(?P<instance_id>\d+)/preview/(?P<debt_id>\d+)/$', 'preview_entry'),
     drl(r'^(?P<instance_id>\d+)/delete/state/(?P<state_id>\d+)/$', 'delete_state'),
+    drl(r'^(?P<instance_id>\d+)/branch/state/(?P<state_id>\d+)/$', 'branch_state'),
+    drl(r'^(?P<instance_id>\d+)/merge/$', 'merge_branch'),
     drl(r'^(?P<instance_id>\d+)/debt/(?P<debt_id>\d+)/$', 'edit_entry'),
     drl(r'^(?P<instance_id>\d+)/debt/advanced/(?P<debt_id>\d+)/$', 'edit_entry_advanced'),
     drl(r'^(?P<instance_id>\d+)/delete/debt/(?P<debt_id>\d+)/$', 'delete_entry'),
+    drl(r'^(?P<instance_id>\d+)/pending/(?P<change_id>\d+)/$', 'pending'),
     drl(r'^(?P<instance_id>\d+)/people/$', 'people'),
     drl(r'^(?P<instance_id>\d+)/person/(?P<person_id>\d+)$', 'edit_person'),
+    drl(r'^(?P<instance_id>\d+)/person/(?P<person_id>\d+)/statement/$', 'statement'),
+    drl(r'^(?P<instance_id>\d+)/person/(?P<person_id>\d+)/statement/json/$', 'statement_json'),
+)
 
-    # Uncomment the admin/doc line below to enable admin documentation:
+if 'django.contrib.admindocs' in settings.INSTALLED_APPS:
+  urlpatterns += patterns('',
     url(r'^admin/doc/', include('django.contrib.admindocs.urls')),
+  )
 
-    # Uncomment the next line to enable the admin:
-    url(r'^admin/', include(admin.site.urls)),
-)
+# The admin is only mounted by module name (include() would import it now),
+# so it is imported and autodiscovered when an admin URL is first used.
+
+if 'django.contrib.admin' in settings.INSTALLED_APPS:
+  urlpatterns += patterns('',
+    url(r'^admin/', ('debt.admin_urls', 'admin', 'admin')),
+  )
 
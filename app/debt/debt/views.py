@@ -1,9 +1,20 @@
-from django.shortcuts import render
-from debt.models import Debt, Person, Instance, State
-from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404, render
+from debt.models import Debt, Person, Instance, State, PendingChange
+from debt.pending import enqueue
+from debt.routing import replica_reads
+from debt.statement import Statement
+from debt import branching, checkpoint, duplicates, events, groups, history, preview
+from debt.search import search as find_debts
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.conf import settings
+from django.core.cache import cache as row_cache
+from django.db import close_connection, transaction
+from django.http import Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.core.urlresolvers import reverse
 from functools import cmp_to_key
-from datetime import datetime
+import json
+import time
+from datetime import datetime, timedelta
 
 class DotExpandedDict(dict):
     """
@@ -38,6 +49,7 @@ class DotExpandedDict(dict):
             except TypeError: # Special-case if current isn't a dict.
                 current = {bits[-1]: v}
 
+@replica_reads
 def people(request, instance_id):
   instance = Instance.objects.get(id=instance_id)
 
@@ -52,24 +64,34 @@ def people(request, instance_id):
 
 
 # Emulates the spreadsheet's entries view
+@replica_reads
 def entries(request, instance_id):
   instance = Instance.objects.get(id=instance_id)
 
   try:
     state = instance.latest_state()
-    entries = state.debts.order_by('-date')
+    entries = state.debts.select_related('debtee').order_by('-date')
   except State.DoesNotExist:
+    state = None
     entries = []
 
-  context = {'entries': entries, 'instance': instance }
+  context = {'entries': entries, 'instance': instance, 'state': state }
   return render(request, 'debt/entries.html', context)
 
+# Views which write a new State run in a transaction, so a State is never
+# seen half written (its summary rows are cached by id). They lock the
+# instance row first, as pending.apply_pending does, so that two writes
+# (queued or not) can't both clone the same head State.
+
+@transaction.commit_on_success
 def delete_state(request, instance_id, state_id):
-  instance = Instance.objects.get(id=instance_id)
-  latest = instance.latest_state()
+  instance = Instance.objects.select_for_update().get(id=instance_id)
 
   try:
-    if latest.id == int(state_id):
+    # Only the head of a branch can be deleted, and only if nothing has been
+    # branched or merged from it
+    latest = instance.state_set.get(id=state_id)
+    if latest.id == instance.latest_state(latest.branch).id and not latest.children().exists():
       for person in latest.people.all():
         if len(person.state_set.all()) == 1:
           person.delete()
@@ -78,14 +100,17 @@ def delete_state(request, instance_id, state_id):
           for subdebt in debt.subdebt_set.all():
             subdebt.delete()
           debt.delete()
+      history.forget(latest)
+      forget_rows(latest)
       latest.delete()
   except Exception as e:
     return HttpResponseRedirect(reverse('changes', args=(instance.id,)))
   else:
     return HttpResponseRedirect(reverse('changes', args=(instance.id,)))
 
+@transaction.commit_on_success
 def add_person(request, instance_id):
-  instance = Instance.objects.get(id=instance_id)
+  instance = Instance.objects.select_for_update().get(id=instance_id)
 
   try:
     pop = int(request.POST['plusone'])
@@ -132,8 +157,9 @@ def debtor(person, debt):
       return True
   return False
 
+@transaction.commit_on_success
 def edit_person(request, instance_id, person_id):
-  instance = Instance.objects.get(id=instance_id)
+  instance = Instance.objects.select_for_update().get(id=instance_id)
 
   try:
     latest = instance.latest_state()
@@ -164,6 +190,9 @@ def edit_person(request, instance_id, person_id):
       nperson = nstate.people.create(name=name,email=request.POST['email'],plusone=plusone,retired=retired)
       nstate.people.remove(person)
 
+      if latest.opening_balances().filter(person=person).exists():
+        nstate.replace_opening_person(person, nperson)
+
       # Update all of the person's debts in the new state to reference the new Person object
 
       for debt in latest.debts.all():
@@ -184,6 +213,7 @@ def edit_person(request, instance_id, person_id):
               ndebt.subdebt_set.create(cost=subdebt.cost,debtor=nperson)
             else:
               ndebt.subdebt_set.create(cost=subdebt.cost,debtor=subdebt.debtor)
+          ndebt.summarise()
           nstate.debts.remove(debt)
 
     except KeyError as e:
@@ -213,8 +243,9 @@ def edit_person(request, instance_id, person_id):
 
   return HttpResponseRedirect(reverse('people', args=(instance.id,)))
 
+@transaction.commit_on_success
 def edit_entry(request, instance_id, debt_id):
-  instance = Instance.objects.get(id=instance_id)
+  instance = Instance.objects.select_for_update().get(id=instance_id)
 
   try:
     latest = instance.latest_state()
@@ -229,12 +260,18 @@ def edit_entry(request, instance_id, debt_id):
       if len(debtors) != len(debtors_u):
         raise Person.DoesNotExist(str(debtors_u) + ' - ' + str(debtors))
 
+      if settings.ASYNC_WRITES:
+        costs = dict([(debtor.id, cost) for debtor in debtors])
+        change = enqueue(instance, PendingChange.EDIT, "Updating debt: " + str(debt.what), debt=debt, what=reason, debtee=debtee, date=date, costs=costs)
+        return queued(instance, change)
+
       # Add the new debt and add the new one
       nstate = latest.clone("Updating debt: " + str(debt.what))
       ndebt = nstate.debts.create(what=reason,debtee=debtee,date=date)
 
       for debtor in debtors:
         ndebt.subdebt_set.create(cost=cost,debtor=debtor)
+      ndebt.summarise()
 
       nstate.debts.remove(debt)
 
@@ -274,13 +311,18 @@ def edit_entry(request, instance_id, debt_id):
   except Debt.DoesNotExist:
     return HttpResponseRedirect(reverse('entries', args=(instance.id,)))
 
+@transaction.commit_on_success
 def delete_entry(request, instance_id, debt_id):
-  instance = Instance.objects.get(id=instance_id)
+  instance = Instance.objects.select_for_update().get(id=instance_id)
   latest = instance.latest_state()
 
   try:
     debt = latest.debts.get(id=debt_id)
 
+    if settings.ASYNC_WRITES:
+      change = enqueue(instance, PendingChange.DELETE, "Deleting debt: " + str(debt.what), debt=debt)
+      return queued(instance, change)
+
     # Add the new debt and add the new one
     nstate = latest.clone("Deleting debt: " + str(debt.what))
 
@@ -291,8 +333,9 @@ def delete_entry(request, instance_id, debt_id):
   else:
     return HttpResponseRedirect(reverse('entries', args=(instance.id,)))
 
+@transaction.commit_on_success
 def add_entry(request, instance_id):
-  instance = Instance.objects.get(id=instance_id)
+  instance = Instance.objects.select_for_update().get(id=instance_id)
 
   try:
     latest = instance.latest_state()
@@ -304,12 +347,34 @@ def add_entry(request, instance_id):
     if len(debtors) != len(debtors_u):
       raise Person.DoesNotExist(str(debtors_u) + ' - ' + str(debtors))
 
+    costs = dict([(debtor.id, cost) for debtor in debtors])
+
+    # Ask before adding what looks like a debt already added (e.g. the form
+    # being submitted twice)
+    duplicate = duplicates.find(latest, datetime.now(), reason, debtee.id, costs)
+    if duplicate and 'confirm' not in request.POST:
+      context = {
+        'instance': instance,
+        'people': latest.people.filter(retired=False).order_by('name'),
+        'duplicate': duplicate,
+        'debtee': debtee.id,
+        'debtors': [debtor.id for debtor in debtors],
+        'reason': reason,
+        'total_cost': request.POST['total_cost'],
+      }
+      return render(request, 'debt/add.html', context)
+
+    if settings.ASYNC_WRITES:
+      change = enqueue(instance, PendingChange.ADD, "Adding new debt for: " + str(reason), what=reason, debtee=debtee, date=datetime.now(), costs=costs)
+      return queued(instance, change)
+
     nstate = latest.clone("Adding new debt for: " + str(reason))
 
     debt = nstate.debts.create(what=reason,debtee=debtee)
 
     for debtor in debtors:
       debt.subdebt_set.create(cost=cost,debtor=debtor)
+    debt.summarise()
 
   except (KeyError, Person.DoesNotExist):
     people = latest.people.filter(retired=False).order_by('name')
@@ -320,8 +385,9 @@ def add_entry(request, instance_id):
   else:
     return HttpResponseRedirect(reverse('entries', args=(instance.id,)))
 
+@transaction.commit_on_success
 def edit_entry_advanced(request, instance_id, debt_id):
-  instance = Instance.objects.get(id=instance_id)
+  instance = Instance.objects.select_for_update().get(id=instance_id)
 
   try:
     latest = instance.latest_state()
@@ -342,6 +408,7 @@ def edit_entry_advanced(request, instance_id, debt_id):
           dperson = nstate.people.get(id=debtor)
           cost =  int(float(debtors[debtor]) * 100.0)
           ndebt.subdebt_set.create(cost=cost,debtor=dperson)
+      ndebt.summarise()
 
       nstate.debts.remove(debt)
 
@@ -376,8 +443,9 @@ def edit_entry_advanced(request, instance_id, debt_id):
     return HttpResponseRedirect(reverse('entries', args=(instance.id,)))
 
 
+@transaction.commit_on_success
 def add_entry_advanced(request, instance_id):
-  instance = Instance.objects.get(id=instance_id)
+  instance = Instance.objects.select_for_update().get(id=instance_id)
 
   try:
     latest = instance.latest_state()
@@ -395,6 +463,7 @@ def add_entry_advanced(request, instance_id):
         dperson = latest.people.get(id=debtor)
         cost = int(float(debtors[debtor]) * 100.0)
         debt.subdebt_set.create(cost=cost,debtor=dperson)
+    debt.summarise()
 
   except (KeyError, Person.DoesNotExist):
     people = latest.people.filter(retired=False).order_by('name')
@@ -405,10 +474,222 @@ def add_entry_advanced(request, instance_id):
   else:
     return HttpResponseRedirect(reverse('entries', args=(instance.id,)))
 
+# A person's own ledger in the latest state, with a running balance. Shows
+# the last (most recent) page unless asked for another.
+def statement_page(request, instance, person_id):
+  latest = instance.latest_state()
+  person = latest.people.get(id=person_id)
+  paginator = Paginator(Statement(latest, person), 50)
+  try:
+    page = paginator.page(request.GET.get('page', paginator.num_pages))
+  except PageNotAnInteger:
+    page = paginator.page(paginator.num_pages)
+  except EmptyPage:
+    page = paginator.page(paginator.num_pages)
+  return person, page
+
+@replica_reads
+def statement(request, instance_id, person_id):
+  instance = Instance.objects.get(id=instance_id)
+  try:
+    person, page = statement_page(request, instance, person_id)
+  except (State.DoesNotExist, Person.DoesNotExist):
+    return HttpResponseRedirect(reverse('people', args=(instance.id,)))
+  context = {'instance': instance, 'person': person, 'page': page}
+  return render(request, 'debt/statement.html', context)
+
+@replica_reads
+def statement_json(request, instance_id, person_id):
+  instance = get_object_or_404(Instance, id=instance_id)
+  try:
+    person, page = statement_page(request, instance, person_id)
+  except (State.DoesNotExist, Person.DoesNotExist):
+    raise Http404
+  data = {
+    'person': person.id,
+    'page': page.number,
+    'pages': page.paginator.num_pages,
+    'count': page.paginator.count,
+    'opening': page.paginator.object_list.opening(),
+    'entries': [entry.as_dict() for entry in page.object_list]
+  }
+  return HttpResponse(json.dumps(data), content_type='application/json')
+
+# Search the latest state's debts
+def search_page(request, instance):
+  latest = instance.latest_state()
+  query = {}
+  filters = {}
+  errors = []
+
+  for key in ['q', 'debtee', 'debtor', 'from', 'to', 'min', 'max']:
+    query[key] = request.GET.get(key, '').strip()
+
+  filters['text'] = query['q']
+  try:
+    for key in ['debtee', 'debtor']:
+      if query[key]:
+        filters[key] = latest.people.get(id=int(query[key]))
+  except (ValueError, Person.DoesNotExist):
+    errors.append('Unknown person')
+  try:
+    if query['from']:
+      filters['date_from'] = datetime.strptime(query['from'], "%d/%m/%Y")
+    if query['to']:
+      filters['date_to'] = datetime.strptime(query['to'], "%d/%m/%Y") + timedelta(days=1)
+  except ValueError:
+    errors.append('Dates should be given as dd/mm/yyyy')
+  try:
+    if query['min']:
+      filters['cost_min'] = int(round(float(query['min']) * 100.0))
+    if query['max']:
+      filters['cost_max'] = int(round(float(query['max']) * 100.0))
+  except ValueError:
+    errors.append('Costs should be given in pounds')
+
+  paginator = Paginator(find_debts(latest, **filters), 50)
+  try:
+    page = paginator.page(request.GET.get('page', 1))
+  except PageNotAnInteger:
+    page = paginator.page(1)
+  except EmptyPage:
+    page = paginator.page(paginator.num_pages)
+
+  return latest, query, page, errors
+
+@replica_reads
+def search(request, instance_id):
+  instance = Instance.objects.get(id=instance_id)
+  try:
+    latest, query, page, errors = search_page(request, instance)
+  except State.DoesNotExist:
+    return HttpResponseRedirect(reverse('add_person', args=(instance.id,)))
+
+  # Repeat the search, without the page, for the pagination links
+  params = request.GET.copy()
+  params.pop('page', None)
+
+  context = {
+    'instance': instance,
+    'people': latest.people.order_by('name'),
+    'query': query,
+    'params': params.urlencode(),
+    'page': page,
+    'error_message': ' '.join(errors)
+  }
+  return render(request, 'debt/search.html', context)
+
+@replica_reads
+def search_json(request, instance_id):
+  instance = get_object_or_404(Instance, id=instance_id)
+  try:
+    latest, query, page, errors = search_page(request, instance)
+  except State.DoesNotExist:
+    raise Http404
+  data = {
+    'page': page.number,
+    'pages': page.paginator.num_pages,
+    'count': page.paginator.count,
+    'errors': errors,
+    'entries': [{
+      'id': debt.id,
+      'date': debt.date.isoformat(),
+      'what': debt.what,
+      'debtee': debt.debtee.name,
+      'debtors': debt.debtors(),
+      'total_cost': debt.total_cost,
+    } for debt in page.object_list]
+  }
+  return HttpResponse(json.dumps(data), content_type='application/json')
+
+# Response for a change queued in place of being applied: 202 Accepted, with
+# the id of the change and where to poll for its progress
+def queued(instance, change):
+  url = reverse('pending', args=(instance.id, change.id))
+  response = HttpResponse(json.dumps({'id': change.id, 'poll': url}), content_type='application/json', status=202)
+  response['Location'] = url
+  return response
+
+def pending(request, instance_id, change_id):
+  instance = get_object_or_404(Instance, id=instance_id)
+  change = get_object_or_404(instance.pendingchange_set, id=change_id)
+  data = {
+    'id': change.id,
+    'status': change.status,
+    'state': change.state_id,
+    'error': change.error
+  }
+  return HttpResponse(json.dumps(data), content_type='application/json')
+
+def close_period(request, instance_id):
+  instance = Instance.objects.get(id=instance_id)
+
+  try:
+    before = request.POST['before'].strip()
+    if before:
+      before = datetime.strptime(before, "%d/%m/%Y")
+    else:
+      before = None
+    checkpoint.close_period(instance, before)
+  except KeyError:
+    context = {'instance': instance}
+    return render(request, 'debt/close.html', context)
+  except ValueError:
+    context = {'instance': instance, 'error_message': 'Dates should be given as dd/mm/yyyy'}
+    return render(request, 'debt/close.html', context)
+  except State.DoesNotExist:
+    pass
+
+  return HttpResponseRedirect(reverse('changes', args=(instance.id,)))
+
+@transaction.commit_on_success
+def branch_state(request, instance_id, state_id):
+  instance = Instance.objects.get(id=instance_id)
+  state = instance.state_set.get(id=state_id)
+
+  try:
+    branching.branch(state, request.POST['name'])
+  except KeyError:
+    context = {'instance': instance, 'state': state}
+    return render(request, 'debt/branch.html', context)
+  except ValueError as e:
+    context = {'instance': instance, 'state': state, 'error_message': str(e)}
+    return render(request, 'debt/branch.html', context)
+
+  return HttpResponseRedirect(reverse('changes', args=(instance.id,)))
+
+# Merge a branch into the main line. If it conflicts, the conflicts are
+# shown, with the choice of which side's version to keep.
+@transaction.commit_on_success
+def merge_branch(request, instance_id):
+  instance = Instance.objects.get(id=instance_id)
+
+  try:
+    branch = request.POST['branch']
+    prefer = {'ours': branching.OURS, 'theirs': branching.THEIRS}.get(request.POST.get('prefer'))
+    branching.merge(instance, branch, prefer=prefer)
+  except branching.MergeConflict as e:
+    context = {'instance': instance, 'branch': branch, 'conflicts': e.conflicts}
+    return render(request, 'debt/merge.html', context)
+  except ValueError as e:
+    context = {'instance': instance, 'branch': branch, 'error_message': str(e)}
+    return render(request, 'debt/merge.html', context)
+  except (KeyError, State.DoesNotExist):
+    pass
+
+  return HttpResponseRedirect(reverse('changes', args=(instance.id,)))
+
+@replica_reads
 def changes(request, instance_id):
   instance = Instance.objects.get(id=instance_id)
-  states = instance.state_set.order_by('date')
-  context = {'states': states, 'instance': instance }
+  states = list(instance.state_set.order_by('date'))
+
+  # The head of each branch
+  heads = {}
+  for state in states:
+    heads[state.branch] = state.id
+
+  context = {'states': states, 'instance': instance, 'heads': heads.values() }
   return render(request, 'debt/states.html', context)
 
 class Summary:
@@ -458,6 +739,27 @@ class Summary:
     return self._depth
   def indent(self):
     return range(self.depth())
+  # Everything summary.html shows for this person, formatted once. The key
+  # changes whenever the rendered row would.
+  def row(self, max_depth):
+    balance = self.balance()
+    css = ''
+    if balance < 0:
+      css = 'danger'
+    elif balance > 0:
+      css = 'success'
+    return {
+      'key': '%d:%d:%d:%d' % (self.id, self.paid, self.owes, self.depth()),
+      'id': self.id,
+      'name': self.name,
+      'balance': balance,
+      'paid_gbp': self.paid_gbp(),
+      'owes_gbp': self.owes_gbp(),
+      'balance_gbp': self.balance_gbp(),
+      'class': css,
+      'indent': self.indent(),
+      'colspan': max_depth - self.depth() + 1,
+    }
 
 
 def find_top_plusone(f, people, cache):
@@ -471,16 +773,24 @@ def find_top_plusone(f, people, cache):
   cache[f] = k
   return k
 
+@replica_reads
 def date(request, instance_id, year, month, day):
   date = datetime(int(year), int(month), int(day) + 1)
   return balances(request, instance_id, 'summary', date=date)
 
+@replica_reads
 def summary(request, instance_id):
   return balances(request, instance_id, 'summary')
 
+@replica_reads
+def state_summary(request, instance_id, state_id):
+  return balances(request, instance_id, 'summary', state_id=state_id)
+
+@replica_reads
 def detailed(request, instance_id):
   return balances(request, instance_id, 'detailed')
 
+@replica_reads
 def individual(request, instance_id):
   return balances(request, instance_id, 'individual')
 
@@ -531,58 +841,174 @@ def detail_sort(x,y):
   # print 'DS: ' + x.name + ' with: ' + y.name + ' => ' + reason + ' ' + str(ret)
   return ret
 
-def balances(request, instance_id, mode, date=None):
-  cache = {}
+# How long to keep the precomputed summary rows of a State
+ROWS_TIMEOUT = 7 * 24 * 60 * 60
+
+def rows_key(state, mode):
+  return 'debt.summary.%s.%s' % (state.cache_key(), mode)
+
+# Drop a deleted State's rows from the cache
+def forget_rows(state):
+  row_cache.delete_many([rows_key(state, mode) for mode in ['summary', 'detailed', 'individual', 'groups']])
+
+def balances(request, instance_id, mode, date=None, state_id=None):
+  instance = Instance.objects.get(id=instance_id)
+  title = mode.title()
+
+  try:
+    if state_id:
+      state = instance.state_set.get(id=state_id)
+      title += ' at: ' + state.reason
+    else:
+      state = instance.latest_state()
+    rows = balance_rows(state, mode, date)
+  except State.DoesNotExist:
+    rows = {'data': [], 'max_indent': 0}
+
+  # The latest summary can be kept up to date by summary_events
+  live = (mode == 'summary' and not date and not state_id
+    and (settings.LIVE_SUMMARY or request.GET.get('live') == '1'))
+
+  return render_balances(request, instance, title, mode, rows, live)
 
+# The rows of a balances page for a State, optionally only counting debts
+# before a date
+def balance_rows(state, mode, date=None):
   people = {}
   data = {}
   max_depth = 0
 
-  instance = Instance.objects.get(id=instance_id)
+  # States don't change once written, so their rows are only worked out once
+  key = None
+  if not date:
+    key = rows_key(state, mode)
+    cached = row_cache.get(key)
+    if cached:
+      return cached
 
-  try:
-    state = instance.latest_state()
+  # Add all the people
 
-    # Add all the people
+  for person in state.people.all():
+    summary = Summary(person.id,person.name,person.plusone_id)
+    if (not person.retired) and (person.plusone_id == None or mode != 'summary'):
+      data[person.id] = summary
+    people[person.id] = summary
 
-    for person in state.people.all():
-      summary = Summary(person.id,person.name,person.plusone_id)
-      if (not person.retired) and (person.plusone == None or mode != 'summary'):
-        data[person.id] = summary
-      people[person.id] = summary
+  for person in people:
+    if people[person].plusone and people[person].plusone in people:
+      people[people[person].plusone].add_sub(people[person])
+      people[person].add_parent(people[people[person].plusone])
 
-    for person in people:
-      if people[person].plusone and people[person].plusone in people:
-        people[people[person].plusone].add_sub(people[person])
-        people[person].add_parent(people[people[person].plusone])
+  for person in people:
+    i = people[person].depth()
+    if i > max_depth:
+      max_depth = i
 
-    for person in people:
-      i = people[person].depth()
-      if i > max_depth:
-        max_depth = i
+  # Add all the debts
 
-    # Add all the debts
+  if date:
+    totals = history.totals_before(state, date)
+  else:
+    totals = history.state_totals(state)
 
-    if date:
-      debts = state.debts.filter(date__lt=date)
-    else:
-      debts = state.debts.all()
+  for person, (paid, owes) in totals.items():
+    # Someone replaced since the period closed (see State.replace_opening_person)
+    if person not in people:
+      continue
+    people[person].add_asset(paid, mode)
+    people[person].add_debt(owes, mode)
 
-    for debt in debts:
-      total = 0
-      for subdebt in debt.subdebt_set.all():
-         people[subdebt.debtor.id].add_debt(subdebt.cost, mode)
-         total += subdebt.cost
-      people[debt.debtee.id].add_asset(total, mode)
+  if mode == 'detailed':
+    sort = sorted(data.values(), key=cmp_to_key(detail_sort))
+  else:
+    sort = sorted(data.values(), key=lambda summary: summary.balance())
+
+  rows = {'data': [x.row(max_depth) for x in sort], 'max_indent': max_depth}
+  if key:
+    row_cache.set(key, rows, ROWS_TIMEOUT)
+  return rows
+
+# The costs of a proposed debt, from the fields of the add or edit forms:
+# either debtor.<id> amounts, or debtor ids sharing total_cost equally
+def entry_costs(data):
+  debtors = DotExpandedDict(data).get('debtor')
+  if isinstance(debtors, dict):
+    costs = [(int(id), int(float(cost or 0) * 100.0)) for id, cost in debtors.items()]
+    return dict([(id, cost) for id, cost in costs if cost > 0])
+  debtors = data.getlist('debtor')
+  cost = int((float(data['total_cost']) * 100.0) / len(debtors))
+  return dict([(int(id), cost) for id in debtors])
+
+# The effect the entry being added (or the debt being edited) would have on
+# balances, with the same fields as the forms. Nothing is written.
+@replica_reads
+def preview_entry(request, instance_id, debt_id=None):
+  instance = Instance.objects.get(id=instance_id)
+  rows = []
 
-    if mode == 'detailed':
-      sort = sorted(data.values(), key=cmp_to_key(detail_sort))
-    else:
-      sort = sorted(data.values(), key=lambda summary: summary.balance())
+  try:
+    latest = instance.latest_state()
+    replaces = None
+    if debt_id:
+      replaces = latest.debts.get(id=debt_id)
+    debtee = int(request.GET['debtee'])
+    costs = entry_costs(request.GET)
+
+    # Only people in the state can be part of a debt, and (as add_entry and
+    # edit_entry check) the debtor list can't include anyone retired
+    people = latest.people.in_bulk(costs.keys() + [debtee])
+    if not isinstance(DotExpandedDict(request.GET).get('debtor'), dict):
+      if len([id for id in costs if id not in people or people[id].retired]) > 0:
+        raise ValueError('Not a debtor')
+    if debtee in people:
+      costs = dict([(id, cost) for id, cost in costs.items() if id in people])
+      plusones = dict(latest.people.values_list('id', 'plusone_id'))
+      rows = preview.preview(balance_rows(latest, 'summary')['data'], plusones, debtee, costs, replaces)
+  except (KeyError, ValueError, ZeroDivisionError):
+    # Not filled in enough yet
+    pass
+  except (State.DoesNotExist, Debt.DoesNotExist):
+    pass
+
+  return HttpResponse(json.dumps({'people': rows}), content_type='application/json')
+
+def group_tree(state):
+  key = rows_key(state, 'groups')
+  tree = row_cache.get(key)
+  if tree is None:
+    tree = groups.tree(state)
+    row_cache.set(key, tree, ROWS_TIMEOUT)
+  return tree
+
+# The plusone tree, with only the top-level groups rendered; the members of
+# a group are fetched from group_json as it is expanded
+@replica_reads
+def group_tree_page(request, instance_id):
+  instance = Instance.objects.get(id=instance_id)
+
+  try:
+    state = instance.latest_state()
+    tree = group_tree(state)
+    rows = [tree['rows'][id] for id in tree['roots']]
   except State.DoesNotExist:
-    sort = []
+    state = None
+    rows = []
+
+  context = {'instance': instance, 'state': state, 'data': rows}
+  return render(request, 'debt/groups.html', context)
+
+@replica_reads
+def group_json(request, instance_id, state_id, person_id):
+  instance = get_object_or_404(Instance, id=instance_id)
+  state = get_object_or_404(instance.state_set, id=state_id)
+  tree = group_tree(state)
+  if int(person_id) not in tree['rows']:
+    raise Http404
+  rows = [tree['rows'][id] for id in tree['children'].get(int(person_id), [])]
+  return HttpResponse(json.dumps({'people': rows}), content_type='application/json')
 
-  context = {'data': sort, 'instance': instance, 'title': mode.title(), 'mode': mode, 'max_indent': max_depth}
+def render_balances(request, instance, title, mode, rows, live=False):
+  context = {'data': rows['data'], 'instance': instance, 'title': title, 'mode': mode, 'max_indent': rows['max_indent'], 'live': live}
 
   template = 'debt/summary.html'
 
@@ -591,3 +1017,45 @@ def balances(request, instance_id, mode, date=None):
 
   return render(request, 'debt/summary.html', context)
 
+# Server-sent events with the summary rows which changed, each time the head
+# State changes (see debt.events). The first event has every row, or if the
+# client is reconnecting, the changes since the State it last saw.
+def summary_events(request, instance_id):
+  instance = get_object_or_404(Instance, id=instance_id)
+  last = request.META.get('HTTP_LAST_EVENT_ID', '')
+
+  def rows_at(state_id):
+    if state_id is None:
+      return {'data': []}
+    return balance_rows(State.objects.get(id=state_id), 'summary')
+
+  def stream():
+    end = time.time() + settings.EVENTS_STREAM_SECONDS
+    seen = None
+    if last.isdigit() and instance.state_set.filter(id=last).exists():
+      seen = int(last)
+    rows = rows_at(seen)
+    head = events.head_id(instance.id)
+
+    while True:
+      if head != seen:
+        new = rows_at(head)
+        yield events.event('balances', head or '', events.changes(rows, new))
+        rows = new
+        seen = head
+
+      # Don't hold a database connection while waiting
+      close_connection()
+
+      remaining = end - time.time()
+      if remaining <= 0:
+        return
+      head = events.wait(instance.id, seen, min(remaining, settings.EVENTS_KEEPALIVE_SECONDS))
+      if head == seen:
+        yield events.keepalive()
+
+  response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+  response['Cache-Control'] = 'no-cache'
+  # Stop nginx buffering the stream
+  response['X-Accel-Buffering'] = 'no'
+  return response
@@ -0,0 +1,28 @@
+# gunicorn settings for serving the site:
+#
+#   gunicorn -c gunicorn.conf.py debt.wsgi:application
+#
+# The workers are gevent's, which patch the standard library (threading,
+# time, sockets) when they start, so each request is a greenlet. A summary
+# page's event stream (see debt.events) then holds a greenlet rather than a
+# worker for as long as it's open. Once the site is served this way, set
+# DJANGO_LIVE_SUMMARY=True to keep every summary page up to date.
+#
+# The MySQL driver is C, so its queries block the worker while they run;
+# watching streams make none of their own (one thread per worker polls for
+# them), so that's only the queries of the pages themselves.
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+
+worker_class = 'gevent'
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# Open requests (mostly event streams) per worker
+worker_connections = 1000
+
+# Streams are ended by the site after EVENTS_STREAM_SECONDS; give them time
+# to finish when the workers are restarted
+graceful_timeout = 30
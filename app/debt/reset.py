@@ -1,11 +1,14 @@
 # vim: set fileencoding=utf-8
 
 import os
+import sys
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "debt.settings")
 
 from datetime import datetime
-from debt.models import Instance, State, Person, SubDebt, Debt
+from collections import Counter
+from debt.models import Instance, State, Person, SubDebt, Debt, fingerprint
+from debt import duplicates
 from reset_local import name
 
 instance = Instance.objects.get(id=1)
@@ -50,9 +53,21 @@ def parse_file():
 
   return data
 
+# Adds the debts which aren't already in the latest state, so that the same
+# file can be imported again after new lines are added to it. A line which
+# appears twice in the file is only skipped as many times as it's present.
 def add_objects(data):
 
-  state = instance.state_set.create(reason='Initial import')
+  try:
+    latest = instance.latest_state()
+    state = latest.clone('Importing debts')
+    present = duplicates.counts(latest)
+  except State.DoesNotExist:
+    latest = None
+    state = instance.state_set.create(reason='Initial import')
+    present = Counter()
+
+  added = 0
 
   for entry in data:
     who = Person.objects.filter(name=name(entry['who']))
@@ -76,6 +91,11 @@ def add_objects(data):
 
     date = datetime.strptime(entry['date'], "%d/%m/%Y %H:%M:%S",)
 
+    digest = fingerprint(date, entry['what'], person.id, dict([(ower.id, cost) for ower in to]))
+    if present[digest] > 0:
+      present[digest] -= 1
+      continue
+
     # Create the Debt object
 
     ndebt = person.debt_set.create(what=entry['what'], date=date)
@@ -86,7 +106,18 @@ def add_objects(data):
 
     for ower in to:
       ndebt.subdebt_set.create(cost=cost, debtor=ower)
+    ndebt.summarise()
+
+    added += 1
+
+  # Nothing new
+  if added == 0 and latest:
+    state.delete()
+
+  return added
 
 if __name__ == "__main__":
-  clear_all()
-  add_objects(parse_file())
+  # --clear wipes all the states and debts first, rather than adding to them
+  if '--clear' in sys.argv[1:]:
+    clear_all()
+  print 'Added %d debts' % add_objects(parse_file())